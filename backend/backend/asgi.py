@@ -5,6 +5,11 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Run it with, for example:
+
+    uvicorn backend.asgi:application --workers 4
+    gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker -w 4
 """
 
 import os
@@ -12,5 +17,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Serve the polled endpoints with the async views (see equipment/async_views.py)
+os.environ.setdefault('CHEMVIZ_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
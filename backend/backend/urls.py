@@ -15,15 +15,31 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from equipment import views
+from equipment import async_views, views
+
+# Under ASGI the async handlers serve the polled, I/O-bound endpoints
+polled = async_views if settings.CHEMVIZ_ASYNC_VIEWS else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/upload/', views.upload_csv,name='upload'),
-    path('api/history/',views.history,name='history'),
+    path('api/history/',polled.history,name='history'),
     path('api/generate-pdf-report/', views.generate_pdf_report, name='generate_pdf_report'),
-    path("api/login/", views.login_view,name='login'),
+    path("api/login/", polled.login_view,name='login'),
+    path('api/uploads/chunked/', views.chunked_upload_init, name='chunked_upload'),
+    path('api/uploads/chunked/<int:session_id>/', views.chunked_upload_detail, name='chunked_upload_detail'),
+    path('api/uploads/chunked/<int:session_id>/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
+    path('api/uploads/<int:upload_id>/', async_views.upload_status, name='upload_status'),
+    path('api/uploads/<int:upload_id>/download/', async_views.upload_download, name='upload_download'),
+    path('api/uploads/<int:upload_id>/appends/', views.upload_appends, name='upload_appends'),
+    path('api/events/', async_views.events, name='events'),
+    path('metrics', views.prometheus_metrics, name='metrics'),
+    path('api/compare/', views.compare, name='compare'),
+    path('api/equipment/<str:name>/series/', views.equipment_series, name='equipment_series'),
+    path('api/export/<str:dataset>.<str:ext>', views.export_data, name='export'),
+    path('api/query/', views.query_uploads, name='query'),
 
 ]
@@ -0,0 +1,67 @@
+"""
+Compare two benchmark results from benchmarks.run.
+
+Prints one line per measurement with the relative change, and exits with
+status 1 if any measurement got worse by more than --threshold (default
+10%), so it can gate a CI job.
+
+    cd backend
+    python -m benchmarks.compare base.json head.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+
+# (path, True if higher is better)
+UPLOAD_FIELDS = [("rows_per_s", True), ("peak_traced_mb", False)]
+LATENCY_FIELDS = [("p50_ms", False), ("p95_ms", False)]
+
+
+def measurements(result):
+    values = {}
+    for entry in result.get("upload", []):
+        for field, higher in UPLOAD_FIELDS:
+            values[f"upload[{entry['rows']}].{field}"] = (entry[field], higher)
+    for section in ("history", "pdf"):
+        for field, higher in LATENCY_FIELDS:
+            if section in result and result[section].get(field) is not None:
+                values[f"{section}.{field}"] = (result[section][field], higher)
+    return values
+
+
+def compare(base, head, threshold):
+    """[(name, base value, head value, relative change, regressed)] for measurements in both."""
+    base_values, head_values = measurements(base), measurements(head)
+    rows = []
+    for name, (old, higher) in base_values.items():
+        if name not in head_values or not old:
+            continue
+        new = head_values[name][0]
+        change = (new - old) / old
+        worse = -change if higher else change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    print(f"{base.get('commit')} -> {head.get('commit')}")
+    rows = compare(base, head, args.threshold)
+    for name, old, new, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:32} {old:>12} {new:>12} {change:+8.1%}{flag}")
+    sys.exit(1 if any(r[-1] for r in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
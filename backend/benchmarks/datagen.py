@@ -0,0 +1,93 @@
+"""
+Synthetic equipment data in the sample_equipment_data.csv schema.
+
+Each Type gets its own operating point (the six Types of the sample file use
+the sample's means; further Types are derived from them), readings are
+normally distributed around it, and a small share of rows are pushed far out
+so the anomaly detector has something to find. The output only depends on
+the arguments, so runs on different commits parse identical files.
+
+    cd backend
+    python -m benchmarks.datagen --rows 1000000 --types 20 -o /tmp/equipment_1m.csv
+"""
+import argparse
+import io
+
+import numpy as np
+import pandas as pd
+
+# (Flowrate, Pressure, Temperature) means and standard deviations per Type,
+# taken from sample_equipment_data.csv
+SAMPLE_TYPES = {
+    "Pump": ((126.8, 5.5, 115.5), (5.4, 0.3, 4.0)),
+    "Compressor": ((97.5, 8.2, 96.5), (3.5, 0.3, 2.1)),
+    "Valve": ((60.0, 4.1, 104.7), (2.0, 0.1, 2.5)),
+    "HeatExchanger": ((152.5, 6.2, 131.0), (3.5, 0.1, 1.4)),
+    "Reactor": ((142.5, 7.4, 139.0), (3.5, 0.2, 1.4)),
+    "Condenser": ((162.5, 6.8, 126.5), (3.5, 0.1, 2.1)),
+}
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+
+
+def type_profiles(types, rng):
+    """Names, means and standard deviations (arrays of shape (types, 3)) for `types` Types."""
+    base = list(SAMPLE_TYPES.items())
+    names, means, stds = [], [], []
+    for i in range(types):
+        name, (mean, std) = base[i % len(base)]
+        if i >= len(base):
+            name = f"{name}-{i // len(base) + 1}"
+            mean = np.array(mean) * rng.uniform(0.8, 1.2, 3)
+        names.append(name)
+        means.append(mean)
+        stds.append(std)
+    return names, np.array(means, dtype=float), np.array(stds, dtype=float)
+
+
+def generate_frame(rows, types=6, seed=0, anomaly_rate=0.001, timestamps=False):
+    rng = np.random.default_rng(seed)
+    names, means, stds = type_profiles(types, rng)
+
+    type_index = rng.integers(0, types, rows)
+    values = means[type_index] + rng.standard_normal((rows, 3)) * stds[type_index]
+    outliers = rng.random(rows) < anomaly_rate
+    values[outliers] += stds[type_index[outliers]] * rng.choice([-8, 8], (int(outliers.sum()), 3))
+
+    type_names = np.array(names, dtype=object)[type_index]
+    # Equipment names repeat per Type (Pump-1, Pump-2, ...) like the sample file
+    equipment_index = rng.integers(1, max(rows // types, 1) + 1, rows)
+    frame = {
+        "Equipment Name": pd.Series(type_names).str.cat(equipment_index.astype(str), sep="-"),
+        "Type": type_names,
+    }
+    for j, metric in enumerate(METRICS):
+        frame[metric] = values[:, j].round(2)
+    if timestamps:
+        start = np.datetime64("2025-01-01T00:00:00")
+        frame["Timestamp"] = start + np.sort(rng.integers(0, 365 * 24 * 3600, rows)).astype("timedelta64[s]")
+    return pd.DataFrame(frame)
+
+
+def generate_csv(rows, types=6, seed=0, anomaly_rate=0.001, timestamps=False):
+    """The generated data set as CSV bytes."""
+    buffer = io.StringIO()
+    generate_frame(rows, types, seed, anomaly_rate, timestamps).to_csv(buffer, index=False)
+    return buffer.getvalue().encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--types", type=int, default=6, help="number of distinct Type values")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--anomaly-rate", type=float, default=0.001)
+    parser.add_argument("--timestamps", action="store_true", help="add a Timestamp column")
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as f:
+        f.write(generate_csv(args.rows, args.types, args.seed, args.anomaly_rate, args.timestamps))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Load test: concurrent simulated clients against a running server.
+
+Starts the backend (runserver, or uvicorn serving backend.asgi) on a free
+port against a temporary SQLite database and archive directory, creates one
+account per virtual user, and has each user follow the desktop app / web
+dashboard flow for --duration seconds:
+
+    login -> (upload -> history -> PDF report)*
+
+with an exponentially distributed think time (mean --think seconds) between
+requests. Prints throughput, latency percentiles and error rate per endpoint,
+and writes the same as JSON with --output. Pass --url to drive a server that
+is already running instead (the users given by --username/--password must
+exist there).
+
+    cd backend
+    python -m benchmarks.loadtest --users 20 --duration 60 --server uvicorn --workers 4
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from datetime import datetime, timezone
+
+from .datagen import generate_csv
+from .run import git_commit, percentile_ms
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREATE_USERS = """
+from django.contrib.auth.models import User
+for name in {usernames!r}:
+    user, _ = User.objects.get_or_create(username=name)
+    user.set_password({password!r})
+    user.save()
+"""
+
+
+class Stats:
+    """Latencies and errors per endpoint, shared by the virtual user threads."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, [])
+            self.errors.setdefault(endpoint, 0)
+            if isinstance(status, int) and status < 400:
+                self.latencies[endpoint].append(seconds)
+            else:
+                self.errors[endpoint] += 1
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[str(status)] = counts.get(str(status), 0) + 1
+
+    def summary(self, elapsed):
+        out = {}
+        for endpoint, latencies in self.latencies.items():
+            errors = self.errors[endpoint]
+            total = len(latencies) + errors
+            out[endpoint] = {
+                "requests": total,
+                "per_second": round(total / elapsed, 2),
+                "error_rate": round(errors / total, 4) if total else 0.0,
+                "statuses": self.statuses[endpoint],
+                "p50_ms": percentile_ms(latencies, 50),
+                "p90_ms": percentile_ms(latencies, 90),
+                "p95_ms": percentile_ms(latencies, 95),
+                "p99_ms": percentile_ms(latencies, 99),
+                "max_ms": round(max(latencies) * 1000, 2) if latencies else None,
+            }
+        return out
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        "Content-Type: text/csv\r\n\r\n"
+    ).encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, base_url, username, password, data, stats, deadline, args):
+        super().__init__(daemon=True)
+        self.index = index
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.data = data
+        self.stats = stats
+        self.deadline = deadline
+        self.args = args
+        self.random = random.Random(args.seed + index)
+        self.token = None
+
+    def request(self, endpoint, path, body=None, content_type=None):
+        """Send one request and record it under endpoint; returns the body, or None on error."""
+        headers = {}
+        if content_type:
+            headers["Content-Type"] = content_type
+        if self.token:
+            headers["Authorization"] = f"Token {self.token}"
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers,
+                                     method="POST" if body is not None else "GET")
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.args.timeout) as response:
+                content = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            content, status = None, e.code
+        except (OSError, urllib.error.URLError) as e:
+            content, status = None, type(e).__name__
+        self.stats.add(endpoint, time.perf_counter() - started, status)
+        return content
+
+    def think(self):
+        pause = self.random.expovariate(1 / self.args.think) if self.args.think > 0 else 0
+        time.sleep(min(pause, max(self.deadline - time.time(), 0)))
+
+    def post_json(self, endpoint, path, payload):
+        return self.request(endpoint, path, json.dumps(payload).encode(), "application/json")
+
+    def run(self):
+        time.sleep(self.args.ramp_up * self.index / max(self.args.users, 1))
+        body = self.post_json("login", "/api/login/", {"username": self.username, "password": self.password})
+        if body is None:
+            return
+        self.token = json.loads(body)["token"]
+
+        while time.time() < self.deadline:
+            self.think()
+            body, content_type = multipart("file", f"vu{self.index}.csv", self.data)
+            uploaded = self.request("upload", "/api/upload/", body, content_type)
+            if time.time() >= self.deadline:
+                break
+            self.think()
+            history = self.request("history", "/api/history/")
+            if time.time() >= self.deadline or uploaded is None:
+                continue
+            self.think()
+            self.post_json("pdf", "/api/generate-pdf-report/", {
+                "results": json.loads(uploaded)["summary"],
+                "history": json.loads(history) if history else [],
+                "username": self.username,
+            })
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + "/api/history/", timeout=1)
+            return
+        except urllib.error.HTTPError:
+            return  # 401: up and refusing an anonymous request
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not come up")
+
+
+def start_server(tmp, usernames, args):
+    """Migrate a temporary database, create the users and start the server; returns (process, base url, log)."""
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'loadtest.sqlite3')}",
+        "CHEMVIZ_ARCHIVE_DIR": os.path.join(tmp, "archive"),
+        "CHEMVIZ_METRICS_DIR": os.path.join(tmp, "metrics"),
+    }
+    manage = [sys.executable, "manage.py"]
+    subprocess.run(manage + ["migrate", "--verbosity", "0"], cwd=BACKEND_DIR, env=env, check=True)
+    subprocess.run(manage + ["shell", "-c", CREATE_USERS.format(usernames=usernames, password=args.password)],
+                   cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    port = free_port()
+    if args.server == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", "127.0.0.1",
+                   "--port", str(port), "--workers", str(args.workers), "--no-access-log"]
+    else:
+        command = manage + ["runserver", f"127.0.0.1:{port}", "--noreload"]
+    log = open(os.path.join(tmp, "server.log"), "w+")
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url, process)
+    except RuntimeError:
+        process.kill()
+        log.seek(0)
+        sys.stderr.write(log.read()[-4000:])
+        raise
+    return process, base_url, log
+
+
+def print_table(summary, elapsed):
+    print(f"{'endpoint':10} {'requests':>9} {'req/s':>8} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'max ms':>9}", file=sys.stderr)
+    for endpoint in ("login", "upload", "history", "pdf"):
+        s = summary.get(endpoint)
+        if s is None:
+            continue
+        print(f"{endpoint:10} {s['requests']:>9} {s['per_second']:>8} {s['error_rate']:>7.1%} "
+              f"{s['p50_ms'] or '-':>9} {s['p95_ms'] or '-':>9} {s['p99_ms'] or '-':>9} {s['max_ms'] or '-':>9}",
+              file=sys.stderr)
+    print(f"{elapsed:.1f} s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after login")
+    parser.add_argument("--ramp-up", type=float, default=5, help="seconds over which users start")
+    parser.add_argument("--think", type=float, default=1.0, help="mean think time between requests (s)")
+    parser.add_argument("--rows", type=int, default=1_000, help="rows per uploaded CSV")
+    parser.add_argument("--types", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout (s)")
+    parser.add_argument("--server", choices=["runserver", "uvicorn"], default="runserver")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--url", help="drive this running server instead of starting one")
+    parser.add_argument("--username", default="loadtest",
+                        help="account name; with --users > 1 and no --url, a numeric suffix is added per user")
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--output", help="also write the result as JSON here")
+    args = parser.parse_args()
+
+    if args.url:
+        usernames = [args.username] * args.users
+    else:
+        usernames = [f"{args.username}-{i}" for i in range(args.users)]
+    data = generate_csv(args.rows, args.types, args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = log = None
+        base_url = args.url.rstrip("/") if args.url else None
+        if base_url is None:
+            process, base_url, log = start_server(tmp, sorted(set(usernames)), args)
+        try:
+            stats = Stats()
+            began = time.time()
+            deadline = began + args.ramp_up + args.duration
+            users = [VirtualUser(i, base_url, name, args.password, data, stats, deadline, args)
+                     for i, name in enumerate(usernames)]
+            for user in users:
+                user.start()
+            for user in users:
+                user.join()
+            elapsed = time.time() - began
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+                log.close()
+
+    summary = stats.summary(elapsed)
+    print_table(summary, elapsed)
+    result = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "server": "external" if args.url else args.server,
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "password", "url")},
+        "seconds": round(elapsed, 2),
+        "endpoints": summary,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(result, indent=2) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark suite for ingestion, history and PDF reporting.
+
+Requests go through the full Django stack in-process (test client, token
+auth, middleware) against a throwaway database, so results reflect the code
+of the checked-out commit rather than a server or network. Measured:
+
+  upload   POST /api/upload/ with generated CSVs of each --rows size:
+           median wall time, rows/s, MB/s, and peak traced memory (a separate
+           run under tracemalloc, which slows allocation down)
+  history  GET /api/history/ latency with --history-rows UploadHistory rows
+  pdf      POST /api/generate-pdf-report/ latency
+
+The result is one JSON document (stdout, or --output) tagged with the git
+commit; compare two of them with benchmarks.compare.
+
+    cd backend
+    python -m benchmarks.run --rows 1000 100000 1000000 --types 6 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from .datagen import generate_csv
+
+
+def percentile_ms(values, q):
+    if len(values) < 2:
+        return round(values[0] * 1000, 2) if values else None
+    return round(statistics.quantiles(values, n=100, method="inclusive")[q - 1] * 1000, 2)
+
+
+def latency_summary(values):
+    return {
+        "runs": len(values),
+        "p50_ms": percentile_ms(values, 50),
+        "p95_ms": percentile_ms(values, 95),
+        "max_ms": round(max(values) * 1000, 2),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def setup_django(tmp, database_url):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    os.environ["DATABASE_URL"] = database_url or f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}"
+    os.environ["CHEMVIZ_ARCHIVE_DIR"] = os.path.join(tmp, "archive")
+    os.environ.setdefault("CHEMVIZ_TIMING_ENABLED", "0")
+
+    import django
+    django.setup()
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    settings.DEBUG = False  # DEBUG keeps every query in memory
+    setup_test_environment()
+    call_command("migrate", verbosity=0)
+
+
+def client():
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+
+    user, _ = User.objects.get_or_create(username="benchmark")
+    token, _ = Token.objects.get_or_create(user=user)
+    api = APIClient()
+    api.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return api
+
+
+def post_upload(api, name, data):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    response = api.post("/api/upload/", {"file": SimpleUploadedFile(name, data)})
+    if response.status_code != 200:
+        raise RuntimeError(f"upload failed ({response.status_code}): {response.content[:200]!r}")
+    return response.json()
+
+
+def bench_upload(api, rows, args):
+    data = generate_csv(rows, args.types, args.seed, timestamps=args.timestamps)
+    name = f"bench_{rows}.csv"
+
+    times = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        body = post_upload(api, name, data)
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    post_upload(api, name, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "rows": rows,
+        "types": args.types,
+        "bytes": len(data),
+        "median_s": round(median, 4),
+        "rows_per_s": round(rows / median),
+        "mb_per_s": round(len(data) / 1e6 / median, 2),
+        "peak_traced_mb": round(peak / 1e6, 1),
+        "peak_to_input_ratio": round(peak / len(data), 2),
+    }, body["summary"]
+
+
+def bench_history(api, args):
+    from equipment.models import UploadHistory
+
+    existing = UploadHistory.objects.count()
+    missing = max(args.history_rows - existing, 0)
+    for start in range(0, missing, 10_000):
+        UploadHistory.objects.bulk_create([
+            UploadHistory(
+                file_name=f"history_{start + i}.csv", total_equipment=100, avg_flowrate=120.0,
+                avg_pressure=6.0, avg_temperature=115.0, type_distribution='{"Pump": 100}',
+            )
+            for i in range(min(10_000, missing - start))
+        ])
+
+    times = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        response = api.get("/api/history/")
+        times.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return {"table_rows": UploadHistory.objects.count(), **latency_summary(times)}, response.json()
+
+
+def bench_pdf(api, results, history, args):
+    payload = {"results": results, "history": history, "username": "benchmark"}
+    times = []
+    for _ in range(args.requests):
+        started = time.perf_counter()
+        response = api.post("/api/generate-pdf-report/", payload, format="json")
+        times.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.status_code
+    return {"bytes": len(response.content), **latency_summary(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000],
+                        help="upload sizes to benchmark (1K-10M)")
+    parser.add_argument("--types", type=int, default=6, help="Type cardinality of the generated data")
+    parser.add_argument("--timestamps", action="store_true", help="include a Timestamp column")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="timed uploads per size")
+    parser.add_argument("--history-rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=50, help="history and PDF requests")
+    parser.add_argument("--only", choices=["upload", "history", "pdf"], nargs="+",
+                        default=["upload", "history", "pdf"])
+    parser.add_argument("--database-url", help="benchmark this database instead of a temporary SQLite file")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_django(tmp, args.database_url)
+        from django.db import connection
+
+        api = client()
+        result = {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": connection.vendor,
+            "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "database_url")},
+            "upload": [],
+        }
+
+        summary = None
+        if "upload" in args.only:
+            # Warm-up: first-request imports and connection setup are not part of any size
+            post_upload(api, "warmup.csv", generate_csv(1_000, args.types, args.seed))
+            for rows in args.rows:
+                entry, summary = bench_upload(api, rows, args)
+                result["upload"].append(entry)
+                print(f"upload {rows} rows: {entry['rows_per_s']} rows/s", file=sys.stderr)
+
+        history = []
+        if "history" in args.only:
+            result["history"], history = bench_history(api, args)
+
+        if "pdf" in args.only:
+            if summary is None:
+                _, summary = bench_upload(api, 1_000, argparse.Namespace(**{**vars(args), "repeat": 1}))
+            result["pdf"] = bench_pdf(api, summary, history, args)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
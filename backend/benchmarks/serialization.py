@@ -0,0 +1,135 @@
+"""
+Serialization and compression benchmark for large API responses.
+
+Builds two payloads from generated data sets: an upload summary (per-Type
+statistics and flagged rows) and a history response of --entries uploads,
+each carrying its stored aggregates. For each, reports the median time to
+render it with DRF's JSONRenderer and with equipment.renderers.ORJSONRenderer,
+and the size and time of gzip and (if installed) Brotli compression at the
+levels the middleware uses. No database or server is involved.
+
+    cd backend
+    python -m benchmarks.serialization --types 40 --entries 500 --output serialization.json
+"""
+import argparse
+import gzip
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+from .datagen import generate_csv
+from .run import git_commit
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    django.setup()
+
+
+def summarize(args, seed):
+    from equipment.ingest import finalize_summary, parse_csv
+
+    _, partial, _ = parse_csv("bench.csv", generate_csv(args.rows, args.types, seed))
+    return finalize_summary(partial)
+
+
+def history_entry(i, summary):
+    return {
+        "id": i,
+        "time": "01-05-2024 12:30",
+        "file_name": f"plant_{i}.csv",
+        "total_equipment": summary["total_equipment"],
+        "avg_flowrate": summary["avg_flowrate"],
+        "avg_pressure": summary["avg_pressure"],
+        "avg_temperature": summary["avg_temperature"],
+        "type_distribution": summary["type_distribution"],
+        "aggregates": {
+            "statistics": summary["statistics"],
+            "by_type": summary["by_type"],
+            "anomalies": {k: summary["anomalies"][k] for k in ("total_flagged", "by_metric")},
+            "validation": summary["validation"],
+        },
+    }
+
+
+def payloads(args):
+    # Entries cycle through --distinct data sets; repeating one summary would
+    # overstate how well the history compresses
+    summaries = [summarize(args, args.seed + i) for i in range(max(1, min(args.distinct, args.entries)))]
+    history = [history_entry(i, summaries[i % len(summaries)]) for i in range(args.entries)]
+    return {"summary": {"summary": summaries[0]}, "history": history}
+
+
+def median_seconds(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def bench_payload(data, args):
+    from django.conf import settings
+    from rest_framework.renderers import JSONRenderer
+
+    from equipment.middleware import brotli
+    from equipment.renderers import ORJSONRenderer, orjson
+
+    out = {}
+    drf_s, rendered = median_seconds(lambda: JSONRenderer().render(data), args.repeat)
+    out["json_bytes"] = len(rendered)
+    out["drf_render_ms"] = round(drf_s * 1000, 3)
+    if orjson is not None:
+        fast_s, rendered = median_seconds(lambda: ORJSONRenderer().render(data), args.repeat)
+        out["orjson_render_ms"] = round(fast_s * 1000, 3)
+        out["render_speedup"] = round(drf_s / fast_s, 1)
+
+    level = settings.CHEMVIZ_GZIP_LEVEL
+    seconds, compressed = median_seconds(lambda: gzip.compress(rendered, compresslevel=level, mtime=0), args.repeat)
+    out["gzip"] = {"level": level, "bytes": len(compressed), "ratio": round(len(rendered) / len(compressed), 1),
+                   "ms": round(seconds * 1000, 3)}
+    if brotli is not None:
+        quality = settings.CHEMVIZ_BROTLI_QUALITY
+        seconds, compressed = median_seconds(lambda: brotli.compress(rendered, quality=quality), args.repeat)
+        out["brotli"] = {"quality": quality, "bytes": len(compressed),
+                         "ratio": round(len(rendered) / len(compressed), 1), "ms": round(seconds * 1000, 3)}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000, help="rows of the generated data set")
+    parser.add_argument("--types", type=int, default=40, help="Type cardinality (size of by_type)")
+    parser.add_argument("--entries", type=int, default=500, help="uploads in the history payload")
+    parser.add_argument("--distinct", type=int, default=10, help="distinct data sets behind the history entries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement")
+    parser.add_argument("--output", help="write the JSON result here instead of stdout")
+    args = parser.parse_args()
+
+    setup_django()
+    result = {
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parameters": {k: v for k, v in vars(args).items() if k != "output"},
+    }
+    for name, data in payloads(args).items():
+        result[name] = entry = bench_payload(data, args)
+        speedup = f", {entry['render_speedup']}x faster with orjson" if "render_speedup" in entry else ""
+        print(f"{name}: {entry['json_bytes']} bytes, gzip {entry['gzip']['ratio']}x{speedup}", file=sys.stderr)
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
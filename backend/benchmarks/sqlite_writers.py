@@ -0,0 +1,154 @@
+"""
+Concurrent-writer benchmark for the SQLite profiles in backend/database.py.
+
+Writer processes insert batches of readings (like upload_csv) while reader
+processes run the history query, first with Django's default SQLite setup
+(rollback journal, a new connection per request, deferred transactions) and
+then with the tuned profile (WAL, persistent connection, BEGIN IMMEDIATE,
+busy_timeout). Prints one JSON object per profile.
+
+    cd backend
+    python -m benchmarks.sqlite_writers --writers 8 --readers 4 --seconds 10
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from backend.database import SQLITE_TUNING, pragma_statements
+
+SCHEMA = """
+CREATE TABLE history (id INTEGER PRIMARY KEY, created_at TEXT, total INTEGER, avg_flowrate REAL);
+CREATE TABLE readings (
+    id INTEGER PRIMARY KEY, upload_id INTEGER, equipment_name TEXT, equipment_type TEXT,
+    flowrate REAL, pressure REAL, temperature REAL
+);
+CREATE INDEX readings_upload ON readings (upload_id, equipment_name);
+"""
+
+
+def connect(path, profile):
+    # Python's sqlite3 default timeout (5 s) is what Django uses unless told otherwise
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if profile == "tuned":
+        for statement in pragma_statements(SQLITE_TUNING):
+            conn.execute(statement)
+    return conn
+
+
+def writer(path, profile, rows, deadline, start, results):
+    conn = connect(path, profile) if profile == "tuned" else None
+    latencies, errors = [], 0
+    start.wait()
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        try:
+            # Default profile: one connection per request, like CONN_MAX_AGE=0
+            c = conn or connect(path, profile)
+            c.execute("BEGIN IMMEDIATE" if profile == "tuned" else "BEGIN")
+            cur = c.execute("INSERT INTO history (created_at, total, avg_flowrate) VALUES (datetime('now'), ?, ?)",
+                            (rows, random.random() * 100))
+            upload = cur.lastrowid
+            c.executemany(
+                "INSERT INTO readings (upload_id, equipment_name, equipment_type, flowrate, pressure, temperature) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(upload, f"Pump-{i}", "Pump", random.random(), random.random(), random.random()) for i in range(rows)],
+            )
+            c.execute("COMMIT")
+            latencies.append(time.perf_counter() - t0)
+        except sqlite3.OperationalError:
+            errors += 1
+            try:
+                c.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        finally:
+            if conn is None:
+                c.close()
+    results.put(("writer", latencies, errors))
+
+
+def reader(path, profile, deadline, start, results):
+    conn = connect(path, profile) if profile == "tuned" else None
+    latencies, errors = [], 0
+    start.wait()
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        try:
+            c = conn or connect(path, profile)
+            c.execute("SELECT * FROM history ORDER BY created_at DESC LIMIT 5").fetchall()
+            latencies.append(time.perf_counter() - t0)
+        except sqlite3.OperationalError:
+            errors += 1
+        finally:
+            if conn is None:
+                c.close()
+    results.put(("reader", latencies, errors))
+
+
+def percentile_ms(values, q):
+    if len(values) < 2:
+        return round(values[0] * 1000, 2) if values else None
+    return round(statistics.quantiles(values, n=100, method="inclusive")[q - 1] * 1000, 2)
+
+
+def run(profile, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite3")
+        setup = sqlite3.connect(path)
+        setup.executescript(SCHEMA)
+        setup.close()
+
+        start = multiprocessing.Barrier(args.writers + args.readers + 1)
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds + 1
+        procs = [multiprocessing.Process(target=writer, args=(path, profile, args.rows, deadline, start, results))
+                 for _ in range(args.writers)]
+        procs += [multiprocessing.Process(target=reader, args=(path, profile, deadline, start, results))
+                  for _ in range(args.readers)]
+        for p in procs:
+            p.start()
+        start.wait()
+        began = time.time()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.time() - began
+
+    out = {"profile": profile, "writers": args.writers, "readers": args.readers,
+           "rows_per_transaction": args.rows, "seconds": round(elapsed, 2)}
+    for kind in ("writer", "reader"):
+        latencies = [x for k, lats, _ in collected if k == kind for x in lats]
+        errors = sum(e for k, _, e in collected if k == kind)
+        out[kind] = {
+            "ok": len(latencies),
+            "locked_errors": errors,
+            "per_second": round(len(latencies) / elapsed, 1),
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+            "p99_ms": percentile_ms(latencies, 99),
+        }
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=500, help="readings inserted per transaction")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", choices=["default", "tuned", "both"], default="both")
+    args = parser.parse_args()
+
+    profiles = ["default", "tuned"] if args.profile == "both" else [args.profile]
+    for profile in profiles:
+        print(json.dumps(run(profile, args)))
+
+
+if __name__ == "__main__":
+    main()
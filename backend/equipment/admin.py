@@ -1,3 +1,70 @@
+import os
+
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile, UploadAppend, UploadHistory
+from .profiling import profile_file
+
+
+class UploadAppendInline(admin.TabularInline):
+    model = UploadAppend
+    fields = ('created_at', 'file_name', 'rows', 'total_before', 'total_after', 'user')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UploadHistory)
+class UploadHistoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'file_name', 'total_equipment', 'avg_flowrate', 'avg_pressure', 'avg_temperature', 'created_at')
+    search_fields = ('file_name',)
+    date_hierarchy = 'created_at'
+    readonly_fields = ('created_at',)
+    inlines = [UploadAppendInline]
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'method', 'path', 'status_code', 'duration_ms', 'user', 'profiler', 'download')
+    list_filter = ('view_name', 'profiler', 'status_code')
+    search_fields = ('path',)
+    date_hierarchy = 'created_at'
+    fields = ('created_at', 'user', 'method', 'path', 'view_name', 'status_code', 'duration_ms', 'profiler',
+              'download', 'report')
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        download = self.admin_site.admin_view(self.download_view)
+        return [
+            path('<int:pk>/download/', download, name='equipment_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = self.get_object(request, pk)
+        if profile is None or not self.has_view_permission(request, profile):
+            raise Http404
+        file_path = profile_file(profile)
+        if not os.path.exists(file_path):
+            raise Http404("Profile file no longer exists")
+        return FileResponse(open(file_path, 'rb'), as_attachment=True, filename=os.path.basename(file_path))
+
+    @admin.display(description='profile')
+    def download(self, obj):
+        url = reverse('admin:equipment_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file_path)
 
-# Register your models here.
+    @admin.display(description='summary')
+    def report(self, obj):
+        return format_html('<pre style="font-size: 11px">{}</pre>', obj.summary)
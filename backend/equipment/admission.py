@@ -0,0 +1,153 @@
+"""
+Admission control for ingestion.
+
+Parsing an upload holds many times the file's size in memory, so a burst
+of large uploads can push a worker out of memory. Every ingesting request
+(POST /api/upload/, finalizing a resumable upload) first asks the process's
+controller for a slot. It is turned away at once, with a Retry-After header,
+when this process already runs CHEMVIZ_UPLOAD_MAX_CONCURRENT ingestions (503)
+or when the user already runs CHEMVIZ_UPLOAD_MAX_PER_USER (429). These
+checks run before the request body is read.
+
+Memory is reserved once the files are known (uploads are spooled to disk
+first, which costs no memory): each CSV's estimate is its size times
+CHEMVIZ_UPLOAD_MEMORY_FACTOR, and the request's estimates are summed. A file
+on disk above CHEMVIZ_STREAM_THRESHOLD_BYTES counts as the threshold, since
+it is memory-mapped and parsed in bounded chunks; files held in memory and
+ZIP members count at their full (uncompressed) size. If that does not fit in
+what is left of CHEMVIZ_UPLOAD_MEMORY_BUDGET_BYTES the request is turned
+away (503), and a request estimated above the whole budget is refused
+outright (413). A limit of 0 disables that check.
+
+The limits are per process: with N workers the server admits up to N times
+as many. Rejections are counted in chemviz_upload_rejected_total.
+"""
+import threading
+import zipfile
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import metrics
+
+
+class Rejected(Exception):
+    """A request turned away; status is 429 or 503."""
+
+    def __init__(self, reason, status, message):
+        super().__init__(message)
+        self.reason = reason
+        self.status = status
+
+
+class AdmissionController:
+    def __init__(self):
+        self.active = 0
+        self.per_user = {}
+        self.reserved = 0
+        self._lock = threading.Lock()
+
+    def estimate(self, sizes):
+        """
+        Memory needed to ingest CSVs given as (nbytes, mapped) pairs, where
+        mapped means the file is on disk and memory-mapped by the parser.
+        """
+        threshold = settings.CHEMVIZ_STREAM_THRESHOLD_BYTES
+        estimate = 0
+        for nbytes, mapped in sizes:
+            nbytes = max(nbytes, 0)
+            if mapped and threshold:
+                nbytes = min(nbytes, threshold)
+            estimate += int(nbytes * settings.CHEMVIZ_UPLOAD_MEMORY_FACTOR)
+        budget = settings.CHEMVIZ_UPLOAD_MEMORY_BUDGET_BYTES
+        if budget and estimate > budget:
+            raise Rejected("memory", 413, "This upload needs more memory than the server allows")
+        return estimate
+
+    def _check_memory(self, extra):
+        budget = settings.CHEMVIZ_UPLOAD_MEMORY_BUDGET_BYTES
+        if budget and extra > 0 and self.reserved + extra > budget:
+            raise Rejected("memory", 503, "The server does not have the memory for this upload right now")
+
+    def acquire(self, user_id, sizes=()):
+        """Take a slot for an ingestion of CSVs of sizes (see estimate); returns the reservation, raises Rejected."""
+        reservation = self.estimate(sizes)
+        with self._lock:
+            limit = settings.CHEMVIZ_UPLOAD_MAX_CONCURRENT
+            if limit and self.active >= limit:
+                raise Rejected("process", 503, "The server is busy with other uploads")
+            limit = settings.CHEMVIZ_UPLOAD_MAX_PER_USER
+            if limit and self.per_user.get(user_id, 0) >= limit:
+                raise Rejected("user", 429, f"At most {limit} uploads per user can run at once")
+            self._check_memory(reservation)
+            self.active += 1
+            self.per_user[user_id] = self.per_user.get(user_id, 0) + 1
+            self.reserved += reservation
+        return reservation
+
+    def reserve(self, sizes, held):
+        """Grow a slot's reservation (held bytes) to cover CSVs of sizes (see estimate); returns it, raises Rejected."""
+        reservation = max(self.estimate(sizes), held)
+        with self._lock:
+            self._check_memory(reservation - held)
+            self.reserved += reservation - held
+        return reservation
+
+    def release(self, user_id, reservation):
+        with self._lock:
+            self.active -= 1
+            self.reserved -= reservation
+            if self.per_user[user_id] > 1:
+                self.per_user[user_id] -= 1
+            else:
+                del self.per_user[user_id]
+
+
+controller = AdmissionController()
+
+
+def _counted(func, *args):
+    try:
+        return func(*args)
+    except Rejected as e:
+        metrics.upload_rejected.inc(reason=e.reason)
+        raise
+
+
+class Slot:
+    """An admitted ingestion; reserve() sizes its memory once its files are known."""
+
+    def __init__(self, user_id, reservation):
+        self.user_id = user_id
+        self.reservation = reservation
+
+    def reserve(self, sizes):
+        self.reservation = _counted(controller.reserve, sizes, self.reservation)
+
+
+@contextmanager
+def admit(user_id, sizes=()):
+    """Hold an ingestion slot for the with block; raises Rejected (and counts it) if there is none."""
+    slot = Slot(user_id, _counted(controller.acquire, user_id, sizes))
+    try:
+        yield slot
+    finally:
+        controller.release(user_id, slot.reservation)
+
+
+def upload_sizes(files):
+    """
+    (nbytes, mapped) for the CSVs in uploaded files: each file's size, and
+    whether it is on disk, or each CSV member's uncompressed size for ZIP
+    archives.
+    """
+    sizes = []
+    for f in files:
+        if not zipfile.is_zipfile(f):
+            sizes.append((f.size, hasattr(f, "temporary_file_path")))
+            continue
+        with zipfile.ZipFile(f) as archive:
+            sizes.extend((info.file_size, False) for info in archive.infolist()
+                         if not info.is_dir() and info.filename.lower().endswith(".csv"))
+        f.seek(0)
+    return sizes
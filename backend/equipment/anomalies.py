@@ -0,0 +1,100 @@
+"""
+Vectorized anomaly detection over equipment readings.
+
+A reading is flagged when it sits more than z_threshold standard deviations
+from its Type's mean, outside its Type's IQR fences, or outside the
+configured operating envelope for the metric. Everything is computed with
+whole-column NumPy operations; only the flagged rows reported back are
+turned into Python objects.
+"""
+import numpy as np
+import pandas as pd
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+REASONS = ["zscore", "iqr", "envelope"]
+
+
+def empty_report():
+    return {
+        "total_flagged": 0,
+        "by_metric": {m: dict.fromkeys(REASONS + ["total"], 0) for m in METRICS},
+        "rows": [],
+    }
+
+
+def detect_anomalies(df, envelopes=None, z_threshold=3.0, iqr_k=1.5, row_limit=100):
+    """
+    Flag anomalous readings in df.
+
+    envelopes maps a metric to a (low, high) pair; either bound may be None.
+    Returns counts per metric and reason plus up to row_limit flagged
+    readings, most extreme first.
+    """
+    report = empty_report()
+    if df.empty:
+        return report
+
+    envelopes = envelopes or {}
+    codes, _ = pd.factorize(df["Type"])
+    grouped = df[METRICS].groupby(codes)
+    mean = grouped.mean().to_numpy()[codes]
+    std = grouped.std().to_numpy()[codes]
+    q1 = grouped.quantile(0.25).to_numpy()[codes]
+    q3 = grouped.quantile(0.75).to_numpy()[codes]
+
+    values = df[METRICS].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = (values - mean) / std
+    z = np.where(np.isfinite(z), z, 0.0)
+    iqr = q3 - q1
+
+    flags = {
+        "zscore": np.abs(z) > z_threshold,
+        "iqr": (values < q1 - iqr_k * iqr) | (values > q3 + iqr_k * iqr),
+        "envelope": np.zeros_like(values, dtype=bool),
+    }
+    for j, m in enumerate(METRICS):
+        low, high = (list(envelopes.get(m) or []) + [None, None])[:2]
+        if low is not None:
+            flags["envelope"][:, j] |= values[:, j] < low
+        if high is not None:
+            flags["envelope"][:, j] |= values[:, j] > high
+
+    flagged = flags["zscore"] | flags["iqr"] | flags["envelope"]
+    for j, m in enumerate(METRICS):
+        counts = report["by_metric"][m]
+        for reason in REASONS:
+            counts[reason] = int(flags[reason][:, j].sum())
+        counts["total"] = int(flagged[:, j].sum())
+    report["total_flagged"] = int(flagged.any(axis=1).sum())
+
+    # Only the most extreme readings are materialised as dicts
+    rows, cols = np.nonzero(flagged)
+    severity = np.abs(z[rows, cols]) + flags["envelope"][rows, cols] * 1e6
+    order = np.argsort(-severity, kind="stable")[:row_limit]
+    names = df["Equipment Name"].to_numpy() if "Equipment Name" in df else None
+    types = df["Type"].to_numpy()
+    index = df.index.to_numpy()
+    for r, c in zip(rows[order], cols[order]):
+        report["rows"].append({
+            "row": int(index[r]),
+            "equipment": str(names[r]) if names is not None else None,
+            "type": str(types[r]),
+            "metric": METRICS[c],
+            "value": float(values[r, c]),
+            "zscore": round(float(z[r, c]), 3),
+            "reasons": [reason for reason in REASONS if flags[reason][r, c]],
+        })
+    return report
+
+
+def merge_reports(target, report, row_limit=100):
+    """Fold one anomaly report into another (in place), keeping the row_limit most extreme rows."""
+    target["total_flagged"] += report["total_flagged"]
+    for m in METRICS:
+        for key, n in report["by_metric"][m].items():
+            target["by_metric"][m][key] += n
+    rows = target["rows"] + report["rows"]
+    rows.sort(key=lambda row: ("envelope" not in row["reasons"], -abs(row["zscore"])))
+    target["rows"] = rows[:row_limit]
+    return target
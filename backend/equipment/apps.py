@@ -4,3 +4,21 @@ from django.apps import AppConfig
 class EquipmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'equipment'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from rest_framework.authtoken.models import Token
+
+        from backend.database import apply_sqlite_pragmas
+
+        from .authentication import token_deleted, user_changed
+        from .metrics import install_query_timer
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='chemviz_sqlite_pragmas')
+        connection_created.connect(install_query_timer, dispatch_uid='chemviz_query_timer')
+        # Keep the token cache from serving deleted tokens or deactivated users
+        post_delete.connect(token_deleted, sender=Token, dispatch_uid='chemviz_token_deleted')
+        post_save.connect(user_changed, sender=get_user_model(), dispatch_uid='chemviz_user_saved')
+        post_delete.connect(user_changed, sender=get_user_model(), dispatch_uid='chemviz_user_deleted')
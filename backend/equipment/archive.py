@@ -0,0 +1,195 @@
+"""
+Columnar archive of uploaded data sets.
+
+Each upload's rows are written to compressed Parquet while the CSV is
+parsed, so later analysis can read just the columns it needs, memory-mapped,
+instead of asking the user for the CSV again. An upload's archive is a
+directory of part files read together as one pyarrow dataset; appends add
+parts rather than rewriting the ones already there. pyarrow is optional:
+without it uploads are simply not archived.
+"""
+import os
+import re
+import shutil
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depends on the environment
+    pa = ds = pafs = pq = None
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+PART = "part-{:05d}.parquet"
+PART_NAME = re.compile(r"^\.?part-(\d+)\.parquet$")
+
+
+def archive_enabled():
+    return pq is not None and bool(settings.CHEMVIZ_ARCHIVE_DIR)
+
+
+def archive_file(upload):
+    """Absolute path of an upload's archive, or None if it has none."""
+    if not upload.archive_path:
+        return None
+    return os.path.join(settings.CHEMVIZ_ARCHIVE_DIR, upload.archive_path)
+
+
+def _normalize(df):
+    # Chunks must share one schema, whatever dtypes pandas inferred for each
+    columns = {
+        # Empty names are stored as "", as in store_readings
+        "Equipment Name": (df["Equipment Name"].fillna("").astype(str) if "Equipment Name" in df
+                           else pd.Series("", index=df.index)),
+        "Type": df["Type"].astype(str),
+    }
+    for m in METRICS:
+        columns[m] = pd.to_numeric(df[m], errors="coerce").astype("float64")
+    if "Timestamp" in df:
+        columns["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce", utc=True)
+    return pd.DataFrame(columns)
+
+
+def archive_parts(path):
+    """
+    The Parquet files of an archive in order: the parts of an archive
+    directory, or the file itself for an archive written before parts.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if PART_NAME.match(name) and not name.startswith("."))
+
+
+def archive_dataset(paths):
+    """
+    One pyarrow dataset over the parts of the archives at paths, memory-mapped,
+    with the parts' schemas unified: a column some parts lack (Timestamp, in
+    rows appended from a CSV without one) reads as nulls there.
+    """
+    files = [part for path in paths for part in archive_parts(path)]
+    schema = pa.unify_schemas([pq.read_schema(f, memory_map=True) for f in files]) if files else pa.schema([])
+    return ds.dataset(files, schema=schema, format="parquet", filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+
+class ArchiveWriter:
+    """
+    Streams frames into the upload's archive directory,
+    <archive dir>/upload_<id>/, one row group per frame. A frame whose
+    columns differ from those of the part being written starts a new part,
+    so no column is dropped; readers unify the parts' schemas.
+
+    With keep_existing (appends) the parts already there are left as they
+    are and new rows go to new parts. Those are written under a hidden name,
+    which readers skip, and renamed into place only once the transaction
+    recording the append commits: a rollback leaves the archive as it was.
+    An archive from before parts (one Parquet file) is linked into a new
+    directory as its first part, and the old file is deleted on commit.
+    """
+
+    def __init__(self, upload, keep_existing=False):
+        self.upload = upload
+        self.name = f"upload_{upload.pk}"
+        self.path = os.path.join(settings.CHEMVIZ_ARCHIVE_DIR, self.name)
+        self._existing = archive_file(upload) if keep_existing else None
+        self._created = False
+        self._next = 0
+        self._parts = []  # (written path, published path)
+        self._writer = None
+
+    def _open_directory(self):
+        if self._existing == self.path:
+            indexes = [int(PART_NAME.match(name).group(1)) for name in os.listdir(self.path) if PART_NAME.match(name)]
+            self._next = max(indexes, default=-1) + 1
+            return
+        # Anything already here is left over from a transaction that rolled back
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        self._created = True
+        if self._existing is not None:
+            first = os.path.join(self.path, PART.format(0))
+            try:
+                os.link(self._existing, first)
+            except OSError:
+                shutil.copyfile(self._existing, first)
+            self._next = 1
+
+    def _start_part(self, schema):
+        if self._writer is not None:
+            self._writer.close()
+        else:
+            self._open_directory()
+        name = PART.format(self._next)
+        self._next += 1
+        published = os.path.join(self.path, name)
+        written = os.path.join(self.path, "." + name) if self._existing is not None else published
+        self._parts.append((written, published))
+        self._writer = pq.ParquetWriter(written, schema, compression=settings.CHEMVIZ_ARCHIVE_COMPRESSION)
+
+    def write(self, df):
+        table = pa.Table.from_pandas(_normalize(df), preserve_index=False)
+        if self._writer is None or not table.schema.equals(self._writer.schema):
+            self._start_part(table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        """Finish the parts and point the upload at the archive (the caller saves the upload)."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        superseded = archive_file(self.upload)
+        self.upload.archive_path = self.name
+        pending = [(written, published) for written, published in self._parts if written != published]
+        if pending:
+            transaction.on_commit(lambda: _publish(pending))
+        if superseded is not None and superseded != self.path:
+            remove_on_commit(superseded)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._created:
+            shutil.rmtree(self.path, ignore_errors=True)
+            return
+        for written, _ in self._parts:
+            _remove(written)
+
+
+def _publish(parts):
+    for written, published in parts:
+        os.replace(written, published)
+
+
+def remove_on_commit(path):
+    """
+    Delete an archive (directory or file) once the current transaction
+    commits (at once outside a transaction), so a rollback never leaves an
+    upload pointing at an archive that is gone.
+    """
+    transaction.on_commit(lambda: _remove(path))
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_archive(upload, columns=None, filters=None):
+    """
+    Read an upload's archive as a pyarrow Table, memory-mapped and limited to
+    the requested columns (and rows matching a pyarrow dataset expression).
+    """
+    path = archive_file(upload)
+    if path is None or pq is None or not os.path.exists(path):
+        return None
+    return archive_dataset([path]).to_table(columns=columns, filter=filters)
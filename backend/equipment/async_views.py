@@ -0,0 +1,201 @@
+"""
+Async versions of the I/O-bound endpoints, for deployment behind an ASGI
+server (see backend/asgi.py).
+
+DRF's @api_view only runs sync code, so under ASGI every DRF view holds a
+thread from the sync adapter while it waits on the database. These handlers
+are plain async Django views using the async ORM (aget, acount, async
+iteration), so an idle connection costs a coroutine rather than a thread.
+They accept the same "Authorization: Token <key>" header and return the same
+JSON as their DRF counterparts.
+"""
+import asyncio
+import functools
+import json
+import os
+
+from django.conf import settings
+from django.contrib.auth import aauthenticate
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .archive import archive_file, archive_parts
+from .authentication import aauthenticate_key, aissue_token
+from .events import broker, format_event
+from .export import CONTENT_TYPES, stream_archive
+from .models import UploadHistory
+from .renderers import JSONResponse
+from .views import history_entry
+
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+
+
+async def token_user(request, key=None):
+    """
+    The active user named by the request's token, or None (as
+    CachedTokenAuthentication, sharing its cache).
+    key, if given, is used when there is no Authorization header.
+    """
+    parts = request.headers.get("Authorization", "").split()
+    if len(parts) == 2 and parts[0].lower() == "token":
+        key = parts[1]
+    if not key:
+        return None
+    return await aauthenticate_key(key)
+
+
+def unauthorized():
+    response = JSONResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    response["WWW-Authenticate"] = "Token"
+    return response
+
+
+def token_required(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await token_user(request)
+        if request.user is None:
+            return unauthorized()
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def not_found(message):
+    return JSONResponse({"error": message}, status=404)
+
+
+@require_GET
+@token_required
+async def history(request):
+    records = UploadHistory.objects.all().order_by('-created_at')[:5]
+    return JSONResponse([history_entry(r) async for r in records])
+
+
+@csrf_exempt
+@require_POST
+async def login_view(request):
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return JSONResponse({"error": "Invalid JSON"}, status=400)
+    else:
+        data = request.POST
+
+    user = await aauthenticate(
+        request,
+        username=data.get("username"),
+        password=data.get("password"),
+    )
+    if user is None:
+        return JSONResponse({"error": "Invalid credentials"}, status=401)
+
+    token = await aissue_token(user)
+    return JSONResponse({"token": token.key})
+
+
+@require_GET
+@token_required
+async def upload_status(request, upload_id):
+    upload = await UploadHistory.objects.filter(pk=upload_id).afirst()
+    if upload is None:
+        return not_found(f"Upload {upload_id} not found")
+    anomalies = upload.aggregates.get("anomalies", {})
+    archived = archive_file(upload) is not None
+    return JSONResponse({
+        "id": upload.pk,
+        "file_name": upload.file_name,
+        "created_at": upload.created_at,
+        "total_equipment": upload.total_equipment,
+        "avg_flowrate": upload.avg_flowrate,
+        "avg_pressure": upload.avg_pressure,
+        "avg_temperature": upload.avg_temperature,
+        "type_distribution": upload.get_type_distribution(),
+        "anomalies_flagged": anomalies.get("total_flagged"),
+        "readings": await upload.readings.acount(),
+        "archived": archived,
+        "download": f"/api/uploads/{upload.pk}/download/" if archived else None,
+    })
+
+
+async def _read_chunks(path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, DOWNLOAD_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _in_thread(chunks):
+    while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+        yield chunk
+
+
+@require_GET
+@token_required
+async def upload_download(request, upload_id):
+    """Stream the upload's Parquet archive without tying up a thread per client."""
+    upload = await UploadHistory.objects.filter(pk=upload_id).afirst()
+    if upload is None:
+        return not_found(f"Upload {upload_id} not found")
+    path = archive_file(upload)
+    parts = archive_parts(path) if path is not None and os.path.exists(path) else []
+    if not parts:
+        return not_found("No archived data for this upload")
+
+    if len(parts) == 1:
+        response = StreamingHttpResponse(_read_chunks(parts[0]), content_type=CONTENT_TYPES["parquet"])
+        response["Content-Length"] = str(os.path.getsize(parts[0]))
+    else:
+        # Appended parts are joined into one file as it is sent
+        response = StreamingHttpResponse(_in_thread(stream_archive(path)), content_type=CONTENT_TYPES["parquet"])
+    response["Content-Disposition"] = f'attachment; filename="upload_{upload.pk}.parquet"'
+    return response
+
+
+async def _event_stream(user, last_id):
+    subscription = broker.subscribe(user.pk)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event_id, event, data = await asyncio.wait_for(
+                    subscription.queue.get(), settings.CHEMVIZ_EVENTS_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # Catch up on uploads handled by other server processes
+                async for record in UploadHistory.objects.filter(pk__gt=last_id).order_by('pk'):
+                    last_id = record.pk
+                    yield format_event("history", history_entry(record))
+                yield ": keepalive\n\n"
+                continue
+            if event == "history":
+                if data["id"] <= last_id:
+                    continue
+                last_id = data["id"]
+            yield format_event(event, data, event_id)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+@require_GET
+async def events(request):
+    """
+    Server-Sent Events: "upload-progress" for the user's own uploads and
+    "history" for every new upload. EventSource cannot set headers, so the
+    token may also be passed as ?token=.
+    """
+    if not hasattr(request, "scope"):
+        return JSONResponse({"error": "The event stream needs an ASGI server"}, status=501)
+    user = await token_user(request, request.GET.get("token"))
+    if user is None:
+        return unauthorized()
+
+    last_id = (await UploadHistory.objects.aaggregate(last=Max("pk")))["last"] or 0
+    response = StreamingHttpResponse(_event_stream(user, last_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
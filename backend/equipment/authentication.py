@@ -0,0 +1,148 @@
+"""
+Token authentication with an in-process cache.
+
+DRF's TokenAuthentication joins Token and User on every request, which for
+a dashboard polling /api/history/ doubles the query count. CachedTokenAuthentication
+keeps the user behind each key in a dictionary for CHEMVIZ_TOKEN_CACHE_SECONDS,
+so a steady stream of requests costs one lookup. Deleting a token, or saving
+or deleting a user (e.g. deactivating them), drops the affected entries at
+once in this process; other server processes see the change when their
+entries expire, so the TTL bounds how long a revoked token keeps working.
+
+With CHEMVIZ_TOKEN_EXPIRY_SECONDS set, tokens older than that are refused
+and logging in issues a fresh one.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from . import metrics
+
+
+class TokenCache:
+    """Key -> (user, token created, cached at), least recently cached first."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[2] > settings.CHEMVIZ_TOKEN_CACHE_SECONDS:
+                del self._entries[key]
+                return None
+            return entry
+
+    def put(self, key, user, created):
+        if settings.CHEMVIZ_TOKEN_CACHE_SECONDS <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (user, created, time.monotonic())
+            while len(self._entries) > settings.CHEMVIZ_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id):
+        with self._lock:
+            for key in [k for k, (user, _, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = TokenCache()
+
+
+def expired(created):
+    expiry = settings.CHEMVIZ_TOKEN_EXPIRY_SECONDS
+    return bool(expiry) and created < timezone.now() - timedelta(seconds=expiry)
+
+
+def check(user, created):
+    """Raise AuthenticationFailed for an inactive user or an expired token."""
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed("User inactive or deleted.")
+    if expired(created):
+        raise exceptions.AuthenticationFailed("Token has expired.")
+
+
+def authenticate_key(key):
+    """The user a token key belongs to; raises AuthenticationFailed like TokenAuthentication."""
+    entry = cache.get(key)
+    metrics.record_cache("token", entry is not None)
+    if entry is None:
+        try:
+            token = Token.objects.select_related("user").get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed("Invalid token.")
+        entry = (token.user, token.created)
+        cache.put(key, *entry)
+    check(*entry[:2])
+    return entry[0]
+
+
+async def aauthenticate_key(key):
+    """authenticate_key for async views: the user, or None instead of raising."""
+    entry = cache.get(key)
+    metrics.record_cache("token", entry is not None)
+    if entry is None:
+        try:
+            token = await Token.objects.select_related("user").aget(key=key)
+        except Token.DoesNotExist:
+            return None
+        entry = (token.user, token.created)
+        cache.put(key, *entry)
+    try:
+        check(*entry[:2])
+    except exceptions.AuthenticationFailed:
+        return None
+    return entry[0]
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication answered from the token cache in the steady state."""
+
+    def authenticate_credentials(self, key):
+        user = authenticate_key(key)
+        return user, key
+
+
+def issue_token(user):
+    """The user's token for login, replaced by a new one if it has expired."""
+    token, created = Token.objects.get_or_create(user=user)
+    if not created and expired(token.created):
+        token.delete()
+        token = Token.objects.create(user=user)
+    return token
+
+
+async def aissue_token(user):
+    token, created = await Token.objects.aget_or_create(user=user)
+    if not created and expired(token.created):
+        await token.adelete()
+        token = await Token.objects.acreate(user=user)
+    return token
+
+
+def token_deleted(sender, instance, **kwargs):
+    cache.discard(instance.key)
+
+
+def user_changed(sender, instance, **kwargs):
+    cache.discard_user(instance.pk)
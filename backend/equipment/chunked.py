@@ -0,0 +1,72 @@
+"""
+Part files of resumable (chunked) uploads.
+
+A ChunkedUpload's bytes are written to <id>.part in CHEMVIZ_CHUNKED_UPLOAD_DIR
+as the client PUTs them. Each chunk goes to its offset and is hashed while it
+is copied from the request. The PUT claims the offset first
+(ChunkedUpload.writing_since), so a duplicated chunk is refused rather than
+written over the one in flight; ChunkedUpload.offset only advances once a
+chunk has arrived whole (and matched its checksum, if the client sent one).
+Sessions left unfinished are expired by the retention pass.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files import File
+
+COPY_BYTES = 1024 * 1024
+
+
+class ChunkError(Exception):
+    """A chunk that arrived short or did not match its checksum."""
+
+
+class PartFile(File):
+    """An open part file, handed to ingestion by path like a spooled upload."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return os.path.join(settings.CHEMVIZ_CHUNKED_UPLOAD_DIR, f"{session.pk}.part")
+
+
+def create_part(session):
+    os.makedirs(settings.CHEMVIZ_CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(part_path(session), "wb").close()
+
+
+def remove_part(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def write_chunk(session, offset, stream, length, sha256=None):
+    """Copy length bytes from stream to the part file at offset; raises ChunkError."""
+    digest = hashlib.sha256()
+    received = 0
+    with open(part_path(session), "r+b") as f:
+        f.seek(offset)
+        while received < length:
+            block = stream.read(min(COPY_BYTES, length - received))
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            received += len(block)
+    if received != length:
+        raise ChunkError(f"Chunk incomplete: received {received} of {length} bytes")
+    if sha256 and digest.hexdigest() != sha256.lower():
+        raise ChunkError("Chunk checksum mismatch")
+
+
+def file_sha256(session):
+    digest = hashlib.sha256()
+    with open(part_path(session), "rb") as f:
+        for block in iter(lambda: f.read(COPY_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
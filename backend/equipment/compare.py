@@ -0,0 +1,126 @@
+"""
+Compare two uploads.
+
+Metric and per-Type deltas come from the aggregates stored with each
+UploadHistory row. When both uploads kept their rows, each side's readings
+are averaged per equipment name (grouped through the (upload,
+equipment_name) index) and the two are joined on the name, so nothing is
+re-parsed and no rows are loaded into Python.
+"""
+from django.db import connection
+
+from .models import EquipmentReading
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+COLUMNS = {"Flowrate": "flowrate", "Pressure": "pressure", "Temperature": "temperature"}
+STAT_KEYS = ["count", "mean", "std", "min", "max", "p50", "p95", "p99"]
+LEGACY_MEANS = {"Flowrate": "avg_flowrate", "Pressure": "avg_pressure", "Temperature": "avg_temperature"}
+
+
+def _delta(a, b):
+    if a is None or b is None:
+        return None
+    return b - a
+
+
+def _pair(a, b):
+    return {"a": a, "b": b, "delta": _delta(a, b)}
+
+
+def _statistics(upload):
+    stats = upload.aggregates.get("statistics")
+    if stats:
+        return stats
+    # Uploads from before aggregates were stored only have the means
+    return {m: {"count": upload.total_equipment, "mean": getattr(upload, LEGACY_MEANS[m])} for m in METRICS}
+
+
+def _metric_deltas(a, b):
+    stats_a, stats_b = _statistics(a), _statistics(b)
+    return {
+        m: {key: _pair(stats_a[m].get(key), stats_b[m].get(key)) for key in STAT_KEYS
+            if key in stats_a[m] or key in stats_b[m]}
+        for m in METRICS
+    }
+
+
+def _type_deltas(a, b):
+    counts_a, counts_b = a.get_type_distribution(), b.get_type_distribution()
+    by_type_a, by_type_b = a.aggregates.get("by_type", {}), b.aggregates.get("by_type", {})
+    deltas = {}
+    for t in sorted(set(counts_a) | set(counts_b)):
+        entry = {"count": _pair(counts_a.get(t, 0), counts_b.get(t, 0))}
+        for m in METRICS:
+            mean_a = by_type_a.get(t, {}).get(m, {}).get("mean")
+            mean_b = by_type_b.get(t, {}).get(m, {}).get("mean")
+            if mean_a is not None or mean_b is not None:
+                entry[m] = _pair(mean_a, mean_b)
+        deltas[t] = entry
+    return deltas
+
+
+def _row_deltas(a, b, limit):
+    table = connection.ops.quote_name(EquipmentReading._meta.db_table)
+    # One row per equipment and upload: a name repeated in a time series (or
+    # across appends) is compared by its mean, not paired row by row
+    means = ", ".join(f"AVG({c}) AS {c}" for c in COLUMNS.values())
+    per_equipment = (
+        f"(SELECT equipment_name, MAX(equipment_type) AS equipment_type, {means} "
+        f"FROM {table} WHERE upload_id = %s GROUP BY equipment_name)"
+    )
+    join = f"FROM {per_equipment} ra JOIN {per_equipment} rb ON rb.equipment_name = ra.equipment_name"
+    missing = (
+        f"SELECT COUNT(DISTINCT x.equipment_name) FROM {table} x WHERE x.upload_id = %s AND NOT EXISTS "
+        f"(SELECT 1 FROM {table} y WHERE y.upload_id = %s AND y.equipment_name = x.equipment_name)"
+    )
+    averages = ", ".join(f"AVG(rb.{c} - ra.{c})" for c in COLUMNS.values())
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), {averages} {join}", [a.pk, b.pk])
+        matched, *means = cursor.fetchone()
+        cursor.execute(missing, [a.pk, b.pk])
+        only_a = cursor.fetchone()[0]
+        cursor.execute(missing, [b.pk, a.pk])
+        only_b = cursor.fetchone()[0]
+
+        largest = {}
+        for m, c in COLUMNS.items():
+            cursor.execute(
+                f"SELECT ra.equipment_name, ra.equipment_type, ra.{c}, rb.{c} {join} "
+                f"WHERE ra.{c} IS NOT NULL AND rb.{c} IS NOT NULL "
+                f"ORDER BY ABS(rb.{c} - ra.{c}) DESC LIMIT %s",
+                [a.pk, b.pk, limit],
+            )
+            largest[m] = [
+                {"equipment": name, "type": equipment_type, **_pair(va, vb)}
+                for name, equipment_type, va, vb in cursor.fetchall()
+            ]
+
+    return {
+        "matched": matched,
+        "only_in_a": only_a,
+        "only_in_b": only_b,
+        "mean_delta": dict(zip(METRICS, means)),
+        "largest_changes": largest,
+    }
+
+
+def compare_uploads(a, b, rows=False, limit=10):
+    """
+    Deltas from upload a to upload b (b - a).
+
+    The aggregate comparison only reads the two UploadHistory rows. The
+    row-level comparison (rows=True) joins the stored readings and scales
+    with the size of the uploads, so it is opt-in.
+    """
+    result = {
+        "a": {"id": a.pk, "file_name": a.file_name, "created_at": a.created_at},
+        "b": {"id": b.pk, "file_name": b.file_name, "created_at": b.created_at},
+        "total_equipment": _pair(a.total_equipment, b.total_equipment),
+        "metrics": _metric_deltas(a, b),
+        "types": _type_deltas(a, b),
+        "rows": None,
+    }
+    if rows and EquipmentReading.objects.filter(upload=a).exists() and EquipmentReading.objects.filter(upload=b).exists():
+        result["rows"] = _row_deltas(a, b, limit)
+    return result
@@ -0,0 +1,59 @@
+"""
+Downsampling for equipment time series, so charts get a bounded number of
+points however long the history is.
+"""
+import numpy as np
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: keep the first and last points and, from
+    each bucket in between, the point forming the largest triangle with the
+    previously kept point and the average of the next bucket.
+    Returns the indices of the kept points; threshold must be at least 3.
+    """
+    if threshold < 3:
+        raise ValueError("threshold must be at least 3")
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_stop].mean()
+        avg_y = y[next_start:next_stop].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def minmax(x, y, threshold):
+    """
+    Min/max bucketing: split the series into threshold // 2 buckets and keep
+    each bucket's lowest and highest point, so spikes are never dropped.
+    Returns the indices of the kept points; threshold must be at least 3.
+    """
+    if threshold < 3:
+        raise ValueError("threshold must be at least 3")
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n:
+        return np.arange(n)
+
+    starts = np.linspace(0, n, buckets, endpoint=False).astype(int)
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+    # Sorting by (bucket, value) puts each bucket's min first and max last
+    order = np.lexsort((y, bucket))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
@@ -0,0 +1,79 @@
+"""
+In-process event broker behind /api/events/ (Server-Sent Events).
+
+Views publish from whatever thread they run in; every subscriber is an
+asyncio queue owned by one open event stream, fed through its loop's
+call_soon_threadsafe. Events are either addressed to one user (upload
+progress) or broadcast (new history rows).
+
+The broker only reaches streams served by the same process. The stream
+also looks for history rows it has not announced yet on every keepalive,
+so clients behind a multi-worker server still see every upload, just later.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop; a stalled client loses its oldest events
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event, data, user_id=None):
+        """Send an event to user_id's streams, or to every stream if user_id is None."""
+        message = (next(self._ids), event, data)
+        with self._lock:
+            targets = [s for s in self._subscriptions if user_id is None or s.user_id == user_id]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+            except RuntimeError:
+                # The stream's loop has already shut down
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def publish(event, data, user_id=None):
+    broker.publish(event, data, user_id=user_id)
+
+
+def format_event(event, data, event_id=None):
+    """Encode one event in the text/event-stream format."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append("data: " + json.dumps(data, cls=DjangoJSONEncoder))
+    return "\n".join(lines) + "\n\n"
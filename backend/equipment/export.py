@@ -0,0 +1,202 @@
+"""
+Streaming export of upload history and stored readings.
+
+Rows are pulled from the database with .iterator(chunk_size=...) and encoded
+chunk by chunk, so exports of millions of rows never sit in memory at once.
+
+Under WSGI the response iterates stream(). Under ASGI Django would have to
+read a sync iterator to the end before sending anything, so the views hand
+it astream() instead, which fetches each chunk of rows with sync_to_async
+and yields it encoded before fetching the next; both drive the same
+per-format encoders.
+"""
+import csv
+import io
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .archive import archive_dataset, pa, pq
+from .models import EquipmentReading, UploadHistory, parse_type_distribution
+
+DATASETS = {
+    "history": (
+        UploadHistory,
+        ["id", "created_at", "file_name", "total_equipment", "avg_flowrate",
+         "avg_pressure", "avg_temperature", "type_distribution"],
+    ),
+    "readings": (
+        EquipmentReading,
+        ["upload_id", "equipment_name", "equipment_type", "flowrate",
+         "pressure", "temperature", "recorded_at"],
+    ),
+}
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+INTEGER_FIELDS = {"id", "upload_id", "total_equipment"}
+DATETIME_FIELDS = {"created_at", "recorded_at"}
+TEXT_FIELDS = {"file_name", "type_distribution", "equipment_name", "equipment_type"}
+
+
+def parquet_available():
+    return pq is not None
+
+
+def export_queryset(dataset, upload_id=None):
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.order_by("pk")
+    if upload_id is not None:
+        queryset = queryset.filter(**{"pk" if model is UploadHistory else "upload_id": upload_id})
+    return queryset.values_list(*fields), fields
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Echo:
+    """File-like object whose write() hands the encoded line straight back."""
+
+    def write(self, value):
+        return value
+
+
+class CsvEncoder:
+    def __init__(self, fields):
+        self.fields = fields
+        self._writer = csv.writer(_Echo())
+
+    def start(self):
+        return self._writer.writerow(self.fields)
+
+    def encode(self, chunk):
+        return "".join(self._writer.writerow(row) for row in chunk)
+
+    def finish(self):
+        return ""
+
+
+class NdjsonEncoder:
+    def __init__(self, fields):
+        self.fields = fields
+        self._encoder = DjangoJSONEncoder()
+        self._parse = "type_distribution" in fields
+
+    def start(self):
+        return ""
+
+    def encode(self, chunk):
+        lines = []
+        for row in chunk:
+            record = dict(zip(self.fields, row))
+            if self._parse:
+                record["type_distribution"] = parse_type_distribution(record["type_distribution"])
+            lines.append(self._encoder.encode(record))
+        return "\n".join(lines) + "\n"
+
+    def finish(self):
+        return ""
+
+
+class _Drain(io.RawIOBase):
+    """Write-only buffer emptied after every row group, so Parquet can be streamed."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _parquet_type(field):
+    if field in INTEGER_FIELDS:
+        return pa.int64()
+    if field in DATETIME_FIELDS:
+        return pa.timestamp("us", tz="UTC")
+    if field in TEXT_FIELDS:
+        return pa.string()
+    return pa.float64()
+
+
+class ParquetEncoder:
+    def __init__(self, fields):
+        self.fields = fields
+        self._schema = pa.schema([(f, _parquet_type(f)) for f in fields])
+        self._sink = _Drain()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression="zstd")
+
+    def start(self):
+        return self._sink.take()
+
+    def encode(self, chunk):
+        columns = list(zip(*chunk))
+        self._writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(column, type=self._schema.field(f).type) for f, column in zip(self.fields, columns)],
+            schema=self._schema,
+        ))
+        return self._sink.take()
+
+    def finish(self):
+        self._writer.close()
+        return self._sink.take()
+
+
+def stream_archive(path):
+    """An upload's archive (all its parts) as one Parquet file, a record batch at a time."""
+    dataset = archive_dataset([path])
+    sink = _Drain()
+    writer = pq.ParquetWriter(sink, dataset.schema, compression="zstd")
+    for batch in dataset.to_batches():
+        writer.write_batch(batch)
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"csv": CsvEncoder, "ndjson": NdjsonEncoder, "parquet": ParquetEncoder}
+
+
+def stream(ext, queryset, fields, chunk_size):
+    """Encode the queryset's rows as ext, a chunk of chunk_size rows at a time."""
+    encoder = ENCODERS[ext](fields)
+    yield encoder.start()
+    for chunk in _chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        yield encoder.encode(chunk)
+    yield encoder.finish()
+
+
+async def astream(ext, queryset, fields, chunk_size):
+    """stream() as an async generator, for responses served over ASGI."""
+    encoder = ENCODERS[ext](fields)
+    yield encoder.start()
+    # One cursor, read a chunk per trip to the sync thread (QuerySet.aiterator()
+    # opens the cursor of a values_list() in the event loop, which Django refuses)
+    chunks = _chunks(queryset.iterator(chunk_size=chunk_size), chunk_size)
+    fetch = sync_to_async(next)
+    while (chunk := await fetch(chunks, None)) is not None:
+        yield encoder.encode(chunk)
+    yield encoder.finish()
@@ -0,0 +1,426 @@
+"""
+CSV parsing and aggregation for uploads.
+
+Nothing in this module touches Django, so parse_csv can be shipped to a
+process pool (spawned workers only need to import pandas).
+"""
+import functools
+import io
+import math
+import os
+import pathlib
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from . import validation
+from .anomalies import detect_anomalies, empty_report, merge_reports
+from .sketches import RunningStats
+from .timing import stage
+from .validation import ValidationError, Validator
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class MemberTooLarge(ValueError):
+    """A ZIP member whose uncompressed size is over the upload limit."""
+
+
+def expand_uploads(files, extract_dir=None, max_bytes=0):
+    """
+    Return (name, data) for every CSV in the uploaded files, unpacking ZIP
+    archives. data is bytes, or the file's path (a pathlib.Path) for files
+    already on disk (those with temporary_file_path()), which parse_csv then
+    memory-maps instead of reading them into memory. With extract_dir, ZIP
+    members are copied into that directory and passed on as paths as well;
+    the caller removes it once they are parsed.
+
+    A ZIP member over max_bytes uncompressed (0 for no limit) raises
+    MemberTooLarge before anything is extracted.
+    """
+    members = []
+    for f in files:
+        path = f.temporary_file_path() if hasattr(f, "temporary_file_path") else None
+        if path is not None:
+            with open(path, "rb") as head:
+                magic = head.read(4)
+            data = pathlib.Path(path)
+        else:
+            data = f.read()
+            magic = data[:4]
+        if f.name.lower().endswith(".zip") or magic == b"PK\x03\x04":
+            source = data if path is not None else io.BytesIO(data)
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    name = info.filename
+                    if info.is_dir() or name.startswith("__MACOSX/") or not name.lower().endswith(".csv"):
+                        continue
+                    if max_bytes and info.file_size > max_bytes:
+                        raise MemberTooLarge(
+                            f"{name} is {info.file_size} bytes uncompressed; uploads are limited to {max_bytes} bytes")
+                    members.append((name, _extract(archive, info, extract_dir, len(members))))
+        else:
+            members.append((f.name, data))
+    return members
+
+
+def _extract(archive, info, extract_dir, index):
+    """A ZIP member's bytes, or its path once copied into extract_dir."""
+    if extract_dir is None:
+        return archive.read(info)
+    # zipfile stops reading a member at info.file_size, so the size check caps the copy
+    path = pathlib.Path(extract_dir, f"member_{index}.csv")
+    with archive.open(info) as source, open(path, "wb") as target:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    return path
+
+
+PERCENTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+MOMENT_FUNCS = ["count", "sum", "mean", "var", "min", "max"]
+
+
+def _clean(value):
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _exact(moments, quantiles, m):
+    """Exact statistics of metric m from its moments row and quantiles (indexed by q)."""
+    var = float(moments[(m, "var")])
+    stats = {
+        "count": int(moments[(m, "count")]),
+        "mean": _clean(moments[(m, "mean")]),
+        "std": None if math.isnan(var) else math.sqrt(var),
+        "min": _clean(moments[(m, "min")]),
+        "max": _clean(moments[(m, "max")]),
+    }
+    for name, q in PERCENTILES.items():
+        stats[name] = _clean(quantiles.at[q, m])
+    return stats
+
+
+def _exact_statistics(df, overall, by_type):
+    """
+    Exact per-metric and per-Type statistics. The moments come from the
+    agg() partial_aggregate already ran; only the quantiles are computed here,
+    one vectorized call per level.
+    """
+    qs = list(PERCENTILES.values())
+    quantiles = df[METRICS].quantile(qs)
+    type_quantiles = df.groupby("Type")[METRICS].quantile(qs)
+
+    statistics = {m: _exact(overall, quantiles, m) for m in METRICS}
+    types = {}
+    for t, row in by_type.iterrows():
+        types[str(t)] = {m: _exact(row, type_quantiles.loc[t], m) for m in METRICS}
+    return statistics, types
+
+
+def empty_partial():
+    return {
+        "count": 0,
+        "counts": dict.fromkeys(METRICS, 0),
+        "sums": dict.fromkeys(METRICS, 0.0),
+        "type_counts": {},
+        "stats": {m: RunningStats() for m in METRICS},
+        "by_type": {},
+        "anomalies": empty_report(),
+        "validation": validation.empty_report(),
+    }
+
+
+def partial_aggregate(df, exact=True, anomaly_options=None):
+    """
+    Mergeable partial aggregate of one frame: counts, sums, type counts,
+    per-metric / per-Type running statistics and flagged anomalies.
+
+    With exact=True the exact statistics of the frame are attached too; they
+    are used as-is when the frame is summarised on its own. The KLL sketches
+    are then only filled (from the kept metric values) once the partial is
+    merged or stored, see fill_sketches.
+    """
+    partial = empty_partial()
+    partial["count"] = int(len(df))
+    partial["type_counts"] = {str(k): int(v) for k, v in df["Type"].value_counts().items()}
+
+    overall = df[METRICS].agg(MOMENT_FUNCS)
+    by_type = df.groupby("Type")[METRICS].agg(MOMENT_FUNCS)
+    groups = df.groupby("Type").indices
+    values = {m: df[m].to_numpy(dtype=float) for m in METRICS}
+
+    def fold(stats, row, m):
+        n = int(row[(m, "count")])
+        if not n:
+            return
+        m2 = float(row[(m, "var")]) * (n - 1) if n > 1 else 0.0
+        stats.merge_moments(n, float(row[(m, "mean")]), m2, float(row[(m, "min")]), float(row[(m, "max")]))
+
+    overall = overall.unstack()
+    for m in METRICS:
+        partial["counts"][m] = int(overall[(m, "count")])
+        partial["sums"][m] = float(overall[(m, "sum")])
+        fold(partial["stats"][m], overall, m)
+
+    for t, row in by_type.iterrows():
+        type_stats = partial["by_type"].setdefault(str(t), {m: RunningStats() for m in METRICS})
+        for m in METRICS:
+            fold(type_stats[m], row, m)
+
+    partial["anomalies"] = detect_anomalies(df, **(anomaly_options or {}))
+    partial["sketch_values"] = (values, {str(t): idx for t, idx in groups.items()})
+    if exact:
+        partial["exact"] = _exact_statistics(df, overall, by_type)
+    else:
+        fill_sketches(partial)
+    return partial
+
+
+def fill_sketches(partial):
+    """Feed the metric values a partial kept into its KLL sketches (once)."""
+    pending = partial.pop("sketch_values", None)
+    if pending is None:
+        return partial
+    values, groups = pending
+    for m in METRICS:
+        if partial["stats"][m].n:
+            partial["stats"][m].sketch.update(values[m])
+        for t, idx in groups.items():
+            if partial["by_type"][t][m].n:
+                partial["by_type"][t][m].sketch.update(values[m][idx])
+    return partial
+
+
+def merge_into(target, partial, row_limit=100):
+    """Fold one partial aggregate into another (in place); row_limit caps the flagged rows kept."""
+    fill_sketches(target)
+    fill_sketches(partial)
+    target["count"] += partial["count"]
+    for m in METRICS:
+        target["counts"][m] += partial["counts"][m]
+        target["sums"][m] += partial["sums"][m]
+        target["stats"][m].merge(partial["stats"][m])
+    for t, n in partial["type_counts"].items():
+        target["type_counts"][t] = target["type_counts"].get(t, 0) + n
+    for t, stats in partial["by_type"].items():
+        type_stats = target["by_type"].setdefault(t, {m: RunningStats() for m in METRICS})
+        for m in METRICS:
+            type_stats[m].merge(stats[m])
+    merge_reports(target["anomalies"], partial["anomalies"], row_limit)
+    validation.merge_reports(target["validation"], partial["validation"])
+    target.pop("exact", None)
+    return target
+
+
+def merge_partials(partials, row_limit=100):
+    """
+    Combine partial aggregates. Counts, sums, means, std, min and max are
+    exact; merged percentiles come from the KLL sketches. Up to row_limit
+    flagged rows are kept (CHEMVIZ_ANOMALY_ROW_LIMIT in the views).
+    """
+    partials = list(partials)
+    if len(partials) == 1:
+        return partials[0]
+    merged = empty_partial()
+    for p in partials:
+        merge_into(merged, p, row_limit)
+    return merged
+
+
+def partial_to_state(partial):
+    """
+    JSON-serializable form of a partial aggregate, stored so later appends can
+    be merged in without revisiting the rows. Exact statistics are not kept:
+    a summary rebuilt from the state uses the sketches, like a merged one.
+    """
+    fill_sketches(partial)
+    return {
+        "count": partial["count"],
+        "counts": partial["counts"],
+        "sums": partial["sums"],
+        "type_counts": partial["type_counts"],
+        "stats": {m: s.to_dict() for m, s in partial["stats"].items()},
+        "by_type": {t: {m: s.to_dict() for m, s in stats.items()} for t, stats in partial["by_type"].items()},
+        "anomalies": partial["anomalies"],
+        "validation": partial["validation"],
+    }
+
+
+def partial_from_state(state):
+    partial = empty_partial()
+    for key in ("count", "counts", "sums", "type_counts", "anomalies", "validation"):
+        partial[key] = state[key]
+    partial["stats"] = {m: RunningStats.from_dict(s) for m, s in state["stats"].items()}
+    partial["by_type"] = {
+        t: {m: RunningStats.from_dict(s) for m, s in stats.items()} for t, stats in state["by_type"].items()
+    }
+    return partial
+
+
+def finalize_summary(partial):
+    """Turn a partial aggregate into the summary returned by the upload API."""
+    def mean(m):
+        n = partial["counts"][m]
+        return partial["sums"][m] / n if n else 0.0
+
+    if "exact" in partial:
+        statistics, by_type = partial["exact"]
+    else:
+        statistics = {m: partial["stats"][m].summary(PERCENTILES) for m in METRICS}
+        by_type = {
+            t: {m: stats[m].summary(PERCENTILES) for m in METRICS}
+            for t, stats in sorted(partial["by_type"].items())
+        }
+
+    return {
+        "total_equipment": partial["count"],
+        "avg_flowrate": mean("Flowrate"),
+        "avg_pressure": mean("Pressure"),
+        "avg_temperature": mean("Temperature"),
+        "type_distribution": dict(
+            sorted(partial["type_counts"].items(), key=lambda kv: kv[1], reverse=True)
+        ),
+        "statistics": statistics,
+        "by_type": by_type,
+        "anomalies": partial["anomalies"],
+        "validation": partial["validation"],
+    }
+
+
+READING_COLUMNS = ["Equipment Name", "Type", "Timestamp"] + METRICS
+
+
+def member_size(data):
+    """Size in bytes of a member's data (bytes or a path)."""
+    return os.path.getsize(data) if isinstance(data, os.PathLike) else len(data)
+
+
+def _read_csv(name, data, **kwargs):
+    try:
+        if not isinstance(data, os.PathLike):
+            return pd.read_csv(io.BytesIO(data), **kwargs)
+        if not member_size(data):
+            # An empty file cannot be memory-mapped
+            raise pd.errors.EmptyDataError
+        return pd.read_csv(data, memory_map=True, **kwargs)
+    except pd.errors.EmptyDataError:
+        raise ValidationError(f"{name}: the file is empty")
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise ValidationError(f"{name}: not a readable CSV ({e})")
+
+
+def parse_csv(name, data, stream_threshold=None, chunk_rows=250_000, anomaly_options=None,
+              valid_ranges=None, sink=None, keep_frame=False):
+    """
+    Parse one CSV member (bytes, or a path to memory-map) and return
+    (name, partial aggregate, frame).
+
+    Rows are validated and cleaned first (see validation.py); a file that
+    cannot be ingested at all raises ValidationError.
+
+    Members larger than stream_threshold bytes are read in chunks and folded
+    into the running accumulators, so memory stays bounded by the chunk size.
+    sink, if given, is called with every frame/chunk (e.g. to store the rows).
+    frame is only returned with keep_frame=True, for callers that cannot pass
+    a sink (process pool workers).
+    """
+    validator = Validator(name, valid_ranges)
+    if stream_threshold is None or member_size(data) <= stream_threshold:
+        with stage("read_csv"):
+            df = _read_csv(name, data)
+        with stage("validate"):
+            df = validator.clean(df)
+        if df.empty:
+            raise ValidationError(f"{name}: no valid rows")
+        if sink is not None:
+            sink(df)
+        frame = df[[c for c in READING_COLUMNS if c in df]] if keep_frame else None
+        with stage("aggregate"):
+            partial = partial_aggregate(df, anomaly_options=anomaly_options)
+        partial["validation"] = validator.report
+        return name, partial, frame
+
+    partial = empty_partial()
+    row_limit = (anomaly_options or {}).get("row_limit", 100)
+    reader = _read_csv(name, data, chunksize=chunk_rows)
+    while True:
+        with stage("read_csv"):
+            chunk = next(reader, None)
+        if chunk is None:
+            break
+        with stage("validate"):
+            chunk = validator.clean(chunk)
+        if chunk.empty:
+            continue
+        if sink is not None:
+            sink(chunk)
+        with stage("aggregate"):
+            merge_into(partial, partial_aggregate(chunk, exact=False, anomaly_options=anomaly_options),
+                       row_limit)
+    if not partial["count"]:
+        raise ValidationError(f"{name}: no valid rows")
+    partial["validation"] = validator.report
+    return name, partial, None
+
+
+def _get_pool(workers):
+    """The process's parse pool, created once with `workers` processes and shared by all requests."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        # Another request may already have replaced it
+        if _pool is pool:
+            _pool = None
+
+
+def parse_many(members, workers, sinks=None, stream_threshold=None, **options):
+    """
+    Parse several CSVs and return [(name, partial aggregate)] in input order.
+
+    Small members go to a process pool when there is more than one; their
+    frames come back to this process for the sinks. Members above
+    stream_threshold are always streamed in-process so they never have to be
+    held in memory whole. Members given as paths are sent to the pool as
+    paths, so each worker maps the file itself.
+    """
+    sinks = sinks or [None] * len(members)
+    parse = functools.partial(parse_csv, stream_threshold=stream_threshold, **options)
+    results = [None] * len(members)
+
+    pooled = [i for i, (_, data) in enumerate(members)
+              if stream_threshold is None or member_size(data) <= stream_threshold]
+    if workers > 1 and len(pooled) > 1:
+        pool = _get_pool(workers)
+        try:
+            names = [members[i][0] for i in pooled]
+            payloads = [members[i][1] for i in pooled]
+            pooled_parse = functools.partial(parse, keep_frame=True)
+            parsed = pool.map(pooled_parse, names, payloads)
+            for i in pooled:
+                with stage("parse_pool"):
+                    name, partial, frame = next(parsed)
+                if sinks[i] is not None:
+                    sinks[i](frame)
+                results[i] = (name, partial)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM killed); drop the pool and parse in-process below
+            _drop_pool(pool)
+
+    for i, (name, data) in enumerate(members):
+        if results[i] is None:
+            name, partial, _ = parse(name, data, sink=sinks[i])
+            results[i] = (name, partial)
+    return results
@@ -0,0 +1,40 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from equipment.retention import run_forever, run_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Compact readings past the raw retention period into time-bucket rollups and delete "
+        "archives, uploads and unfinished resumable uploads past theirs (see equipment/retention.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--raw-days", type=int, help="override CHEMVIZ_RETENTION_RAW_DAYS (0 = keep)")
+        parser.add_argument("--archive-days", type=int, help="override CHEMVIZ_RETENTION_ARCHIVE_DAYS (0 = keep)")
+        parser.add_argument("--history-days", type=int, help="override CHEMVIZ_RETENTION_HISTORY_DAYS (0 = keep)")
+        parser.add_argument("--chunked-days", type=int, help="override CHEMVIZ_RETENTION_CHUNKED_DAYS (0 = keep)")
+        parser.add_argument("--batch-size", type=int, help="override CHEMVIZ_RETENTION_BATCH_SIZE")
+        parser.add_argument("--dry-run", action="store_true", help="only count what would be compacted or deleted")
+        parser.add_argument("--loop", action="store_true", help="run a pass every --interval seconds until interrupted")
+        parser.add_argument("--interval", type=float, help="override CHEMVIZ_RETENTION_INTERVAL_SECONDS")
+
+    def handle(self, *args, **options):
+        passes = {
+            "raw_days": options["raw_days"],
+            "archive_days": options["archive_days"],
+            "history_days": options["history_days"],
+            "chunked_days": options["chunked_days"],
+            "batch_size": options["batch_size"],
+            "dry_run": options["dry_run"],
+        }
+        if options["loop"]:
+            interval = options["interval"]
+            interval = settings.CHEMVIZ_RETENTION_INTERVAL_SECONDS if interval is None else interval
+            if interval <= 0:
+                raise CommandError("--interval (CHEMVIZ_RETENTION_INTERVAL_SECONDS) must be positive")
+            run_forever(interval, **passes)
+        self.stdout.write(json.dumps(run_retention(**passes)))
@@ -0,0 +1,261 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms live in this process's registry. With several
+worker processes, set CHEMVIZ_METRICS_DIR to a directory they share: each
+process writes a JSON snapshot of its registry there (from a timer, at most
+once per CHEMVIZ_METRICS_FLUSH_SECONDS after a request) and /metrics adds up every
+snapshot in the directory, so any worker can answer a scrape. Snapshots are
+kept after a process exits so counters never go backwards; clear the
+directory when the service is (re)deployed.
+"""
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Buckets in seconds, from a fast history read to a slow multi-file upload
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+THROUGHPUT_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# View name of the request being served, so database queries can be attributed
+current_view = ContextVar("chemviz_view", default="none")
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "type": self.kind,
+                "help": self.documentation,
+                "labels": list(self.labelnames),
+                "samples": [[list(key), self._dump(value)] for key, value in self._samples.items()],
+            }
+
+    def _dump(self, value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                # [count per bucket (not cumulative), sum, count]
+                sample = self._samples[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    sample[0][i] += 1
+                    break
+            sample[1] += value
+            sample[2] += 1
+
+    def snapshot(self):
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+    def _dump(self, value):
+        return [list(value[0]), value[1], value[2]]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._timer = None
+        self._timer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._snapshot_name = f"{os.getpid()}-{time.time_ns()}.json"
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def flush(self, force=False):
+        """
+        Write this process's snapshot to CHEMVIZ_METRICS_DIR: now if force,
+        otherwise from a timer at most once per CHEMVIZ_METRICS_FLUSH_SECONDS.
+        """
+        directory = settings.CHEMVIZ_METRICS_DIR
+        if not directory:
+            return
+        if not force:
+            with self._timer_lock:
+                if self._timer is None:
+                    self._timer = threading.Timer(settings.CHEMVIZ_METRICS_FLUSH_SECONDS, self._timed_flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self._snapshot_name)
+        with self._write_lock:
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + ".tmp", path)
+
+    def _timed_flush(self):
+        with self._timer_lock:
+            self._timer = None
+        self.flush(force=True)
+
+    def collect(self):
+        """This process's metrics merged with every snapshot in CHEMVIZ_METRICS_DIR."""
+        directory = settings.CHEMVIZ_METRICS_DIR
+        if not directory:
+            return self.snapshot()
+        self.flush(force=True)
+        merged = {}
+        for entry in sorted(os.listdir(directory)):
+            if not entry.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, entry)) as f:
+                    merge_snapshot(merged, json.load(f))
+            except (OSError, ValueError):
+                continue  # being replaced or truncated; the next scrape picks it up
+        return merged
+
+
+def merge_snapshot(target, snapshot):
+    """Add the samples of one process snapshot into target."""
+    for name, data in snapshot.items():
+        entry = target.setdefault(name, {**data, "samples": []})
+        samples = {tuple(key): value for key, value in entry["samples"]}
+        for key, value in data["samples"]:
+            key = tuple(key)
+            if key not in samples:
+                samples[key] = value
+            elif data["type"] == "counter":
+                samples[key] = samples[key] + value
+            else:
+                buckets, total, count = samples[key]
+                samples[key] = [[a + b for a, b in zip(buckets, value[0])], total + value[1], count + value[2]]
+        entry["samples"] = [[list(key), value] for key, value in samples.items()]
+    return target
+
+
+def _escape(value):
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def render(snapshot):
+    """Prometheus text exposition of a (merged) snapshot."""
+    lines = []
+    for name, data in snapshot.items():
+        lines.append(f"# HELP {name} {data['help']}")
+        lines.append(f"# TYPE {name} {data['type']}")
+        for key, value in data["samples"]:
+            if data["type"] == "counter":
+                lines.append(f"{name}{_labels(data['labels'], key)} {_number(value)}")
+                continue
+            buckets, total, count = value
+            cumulative = 0
+            for bound, n in zip(data["buckets"], buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(data['labels'], key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(data['labels'], key, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_labels(data['labels'], key)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(data['labels'], key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "chemviz_requests_total", "HTTP requests by view, method and status.", ["view", "method", "status"])
+request_duration = registry.histogram(
+    "chemviz_request_duration_seconds", "Request latency by view.", ["view"])
+upload_bytes = registry.counter(
+    "chemviz_upload_bytes_total", "Bytes received by /api/upload/ (as sent, before unzipping).")
+upload_files = registry.counter(
+    "chemviz_upload_files_total", "CSV files ingested.")
+upload_rows = registry.counter(
+    "chemviz_upload_rows_total", "CSV rows ingested.")
+upload_rejected = registry.counter(
+    "chemviz_upload_rejected_total", "Uploads turned away by admission control, by limit hit.", ["reason"])
+parse_throughput = registry.histogram(
+    "chemviz_parse_rows_per_second", "Rows per second parsed, aggregated and stored per upload request.",
+    buckets=THROUGHPUT_BUCKETS)
+report_duration = registry.histogram(
+    "chemviz_report_render_seconds", "PDF report generation time by stage.", ["stage"])
+cache_requests = registry.counter(
+    "chemviz_cache_requests_total", "Cache lookups by cache and result (hit or miss).", ["cache", "result"])
+db_queries = registry.counter(
+    "chemviz_db_queries_total", "Database queries by view.", ["view"])
+db_query_duration = registry.histogram(
+    "chemviz_db_query_duration_seconds", "Database query time by view.", ["view"], buckets=QUERY_BUCKETS)
+
+
+def record_cache(cache, hit):
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def query_timer(execute, sql, params, many, context):
+    """connection.execute_wrapper that counts and times every query."""
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        view = current_view.get()
+        db_queries.inc(view=view)
+        db_query_duration.observe(time.perf_counter() - started, view=view)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver adding query_timer to every new connection."""
+    if settings.CHEMVIZ_METRICS_ENABLED and query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
@@ -0,0 +1,246 @@
+"""
+Request middleware.
+"""
+import gzip
+import json
+import logging
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+
+from . import metrics, profiling, timing
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+timing_logger = logging.getLogger("chemviz.timing")
+
+
+class TimingMiddleware:
+    """
+    Times every request and reports its stages as a Server-Timing header and
+    a JSON log line on the "chemviz.timing" logger. With
+    CHEMVIZ_TIMING_ENABLED off it removes itself from the stack at startup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.CHEMVIZ_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = timing.clock()
+        timings, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.finish(token)
+        return self._finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        started = timing.clock()
+        timings, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.finish(token)
+        return self._finish(request, response, timings, started)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns; time that as "render"
+        timings = timing.current()
+        if timings is not None:
+            started = timing.clock()
+            response.add_post_render_callback(lambda r: timings.add("render", timing.clock() - started))
+        return response
+
+    def _finish(self, request, response, timings, started):
+        total_ms = (timing.clock() - started) * 1000
+        response["Server-Timing"] = timings.header(total_ms)
+        match = request.resolver_match
+        timing_logger.info(json.dumps({
+            "event": "request_timing",
+            "method": request.method,
+            "path": request.path,
+            "route": match.route if match else None,
+            "status": response.status_code,
+            "duration_ms": round(total_ms, 2),
+            "stages": timings.as_dict(),
+        }))
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and observes their latency per view for /metrics, and
+    names the current view so database queries can be attributed to it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.CHEMVIZ_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = metrics.current_view.set("unresolved")
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_view.reset(token)
+        return self._finish(request, response, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = metrics.current_view.set("unresolved")
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_view.reset(token)
+        return self._finish(request, response, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics.current_view.set(request.resolver_match.view_name or "unnamed")
+
+    def _finish(self, request, response, started):
+        match = request.resolver_match
+        view = (match.view_name or "unnamed") if match else "unmatched"
+        metrics.requests_total.inc(view=view, method=request.method, status=response.status_code)
+        metrics.request_duration.observe(time.perf_counter() - started, view=view)
+        metrics.registry.flush()
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs a request under a profiler when a staff user asks for it with an
+    "X-Profile: 1" header (see equipment/profiling.py); the response then
+    carries X-Profile-Id, the id of the RequestProfile in the admin. With
+    CHEMVIZ_PROFILING_ENABLED off it removes itself from the stack at startup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.CHEMVIZ_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        user = profiling.request_user(request) if profiling.requested(request) else None
+        run = profiling.begin() if user is not None else None
+        if run is None:
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiling.end(run)
+        profile = profiling.save(run, request, response, user, time.perf_counter() - started)
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+    async def __acall__(self, request):
+        user = None
+        if profiling.requested(request):
+            user = await sync_to_async(profiling.request_user)(request)
+        run = profiling.begin(is_async=True) if user is not None else None
+        if run is None:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiling.end(run)
+        profile = await sync_to_async(profiling.save)(run, request, response, user, time.perf_counter() - started)
+        response["X-Profile-Id"] = str(profile.pk)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses JSON and text responses of at least CHEMVIZ_COMPRESSION_MIN_BYTES
+    for clients that accept it: Brotli when the brotli package is installed
+    and the client sends "br", else gzip. Streaming responses (exports, the
+    event stream) and binary ones (PDF, Parquet) are left alone. With
+    CHEMVIZ_COMPRESSION_ENABLED off it removes itself from the stack at startup.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    COMPRESSIBLE = re.compile(r"^(text/|application/(json|x-ndjson|javascript|xml))")
+    ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+    ACCEPTS_BROTLI = re.compile(r"\bbr\b")
+
+    def __init__(self, get_response):
+        if not settings.CHEMVIZ_COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self._compress(request, await self.get_response(request))
+
+    def _compress(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        if not self.COMPRESSIBLE.match(response.get("Content-Type", "")):
+            return response
+        # Whether or not this one is compressed, caches must key on the header
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < settings.CHEMVIZ_COMPRESSION_MIN_BYTES:
+            return response
+
+        accept = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        with timing.stage("compress"):
+            if brotli is not None and self.ACCEPTS_BROTLI.search(accept):
+                encoding = "br"
+                content = brotli.compress(response.content, quality=settings.CHEMVIZ_BROTLI_QUALITY)
+            elif self.ACCEPTS_GZIP.search(accept):
+                encoding = "gzip"
+                content = gzip.compress(response.content, compresslevel=settings.CHEMVIZ_GZIP_LEVEL, mtime=0)
+            else:
+                return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response["Content-Length"] = str(len(content))
+        response["Content-Encoding"] = encoding
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            # The representation changed, so a strong validator no longer holds
+            response["ETag"] = "W/" + etag
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='file_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
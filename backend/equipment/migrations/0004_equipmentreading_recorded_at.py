@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:35
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_recorded_at(apps, schema_editor):
+    # Readings stored before this migration belong to their upload's time
+    EquipmentReading = apps.get_model('equipment', 'EquipmentReading')
+    UploadHistory = apps.get_model('equipment', 'UploadHistory')
+    EquipmentReading.objects.update(
+        recorded_at=Subquery(UploadHistory.objects.filter(pk=OuterRef('upload_id')).values('created_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0003_equipmentreading_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmentreading',
+            name='recorded_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_recorded_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='equipmentreading',
+            index=models.Index(fields=['equipment_name', 'recorded_at'], name='equipment_e_equipme_4019a9_idx'),
+        ),
+    ]
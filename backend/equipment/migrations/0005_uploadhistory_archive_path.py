@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 10:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0004_equipmentreading_recorded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadhistory',
+            name='archive_path',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
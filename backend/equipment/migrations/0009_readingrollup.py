@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0008_uploadstate_uploadappend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('equipment_name', models.CharField(max_length=255)),
+                ('equipment_type', models.CharField(max_length=100)),
+                ('bucket_start', models.DateTimeField()),
+                ('bucket_seconds', models.IntegerField()),
+                ('count', models.IntegerField()),
+                ('flowrate_count', models.IntegerField()),
+                ('flowrate_sum', models.FloatField()),
+                ('flowrate_min', models.FloatField(null=True)),
+                ('flowrate_max', models.FloatField(null=True)),
+                ('pressure_count', models.IntegerField()),
+                ('pressure_sum', models.FloatField()),
+                ('pressure_min', models.FloatField(null=True)),
+                ('pressure_max', models.FloatField(null=True)),
+                ('temperature_count', models.IntegerField()),
+                ('temperature_sum', models.FloatField()),
+                ('temperature_min', models.FloatField(null=True)),
+                ('temperature_max', models.FloatField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['equipment_name', 'bucket_start'], name='equipment_r_equipme_ca41fd_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-19 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0009_readingrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equipmentreading',
+            index=models.Index(fields=['recorded_at'], name='equipment_e_recorde_13f500_idx'),
+        ),
+    ]
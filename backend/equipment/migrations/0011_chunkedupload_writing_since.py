@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 12:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('equipment', '0010_reading_recorded_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='writing_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,5 +1,23 @@
+import ast
+import json
+import re
+
+from django.conf import settings
 from django.db import models
 
+def parse_type_distribution(text):
+    """type_distribution text as a dict; older rows stored a Python repr instead of JSON"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        # e.g. "{'Pump': np.int64(4)}" written by numpy 2
+        return {k: int(v) for k, v in re.findall(r"'([^']*)':\s*(?:np\.int64\()?(\d+)", text)}
+
+
 # Create your models here.
 class UploadHistory(models.Model):
     total_equipment = models.IntegerField() # stored whole number
@@ -8,4 +26,113 @@ class UploadHistory(models.Model):
     avg_temperature = models.FloatField()
     type_distribution = models.TextField() #Databases cannot store dictionary directly so we store as text
     created_at = models.DateTimeField(auto_now_add=True) #stores date and time in auto mdoe
-    
\ No newline at end of file
+    file_name = models.CharField(max_length=255, blank=True) # name of the CSV (or ZIP member) this row summarises
+    aggregates = models.JSONField(default=dict, blank=True) # statistics, per-Type breakdown and anomaly counts from the upload summary
+    archive_path = models.CharField(max_length=255, blank=True) # Parquet parts of the rows, relative to CHEMVIZ_ARCHIVE_DIR
+
+    def get_type_distribution(self):
+        return parse_type_distribution(self.type_distribution)
+
+
+# One row of an uploaded CSV, kept so uploads can be compared row by row and
+# so each piece of equipment has a time series across uploads
+class EquipmentReading(models.Model):
+    upload = models.ForeignKey(UploadHistory, on_delete=models.CASCADE, related_name='readings')
+    equipment_name = models.CharField(max_length=255)
+    equipment_type = models.CharField(max_length=100)
+    flowrate = models.FloatField(null=True) # null when the cell was empty
+    pressure = models.FloatField(null=True)
+    temperature = models.FloatField(null=True)
+    recorded_at = models.DateTimeField() # the row's Timestamp column if the CSV has one, else the upload time
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['upload', 'equipment_name']),
+            models.Index(fields=['equipment_name', 'recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
+
+# A resumable upload in progress: the client PUTs chunks at increasing
+# offsets, then finalizes it into an ordinary upload (equipment/chunked.py)
+class ChunkedUpload(models.Model):
+    UPLOADING, FINALIZING, COMPLETE = 'uploading', 'finalizing', 'complete'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    file_name = models.CharField(max_length=255)
+    size = models.BigIntegerField() # total bytes the client will send
+    offset = models.BigIntegerField(default=0) # bytes received so far, contiguous from the start
+    writing_since = models.DateTimeField(null=True, blank=True) # set while a PUT writes the chunk at offset
+    status = models.CharField(max_length=10, default=UPLOADING)
+    upload = models.ForeignKey(UploadHistory, null=True, blank=True, on_delete=models.SET_NULL) # set on finalize
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# A request run under the profiler at a staff user's request (X-Profile
+# header), listed in the admin; the profile itself is a file in CHEMVIZ_PROFILE_DIR
+class RequestProfile(models.Model):
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view_name = models.CharField(max_length=100, blank=True)
+    status_code = models.IntegerField()
+    duration_ms = models.FloatField()
+    profiler = models.CharField(max_length=20) # "pyinstrument" or "cprofile"
+    file_path = models.CharField(max_length=255) # relative to CHEMVIZ_PROFILE_DIR
+    summary = models.TextField(blank=True) # text report of the hottest call paths
+
+    class Meta:
+        ordering = ['-created_at']
+
+
+# Mergeable partial aggregate behind an upload's summary (ingest.partial_to_state),
+# so rows appended later are folded in without rereading the earlier ones
+class UploadState(models.Model):
+    upload = models.OneToOneField(UploadHistory, on_delete=models.CASCADE, primary_key=True, related_name='state')
+    state = models.JSONField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# One file appended to an existing upload (POST /api/upload/ with append_to), kept for auditing
+class UploadAppend(models.Model):
+    upload = models.ForeignKey(UploadHistory, on_delete=models.CASCADE, related_name='appends')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, on_delete=models.SET_NULL)
+    file_name = models.CharField(max_length=255, blank=True)
+    rows = models.IntegerField() # rows this file added
+    total_before = models.IntegerField()
+    total_after = models.IntegerField()
+    validation = models.JSONField(default=dict, blank=True) # this file's validation report
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+
+# Readings past the raw retention period, compacted into per-equipment time
+# buckets (equipment/retention.py). A bucket may have several rows, one per
+# compaction batch that touched it; readers sum them
+class ReadingRollup(models.Model):
+    equipment_name = models.CharField(max_length=255)
+    equipment_type = models.CharField(max_length=100)
+    bucket_start = models.DateTimeField()
+    bucket_seconds = models.IntegerField()
+    count = models.IntegerField() # readings folded into this row
+    flowrate_count = models.IntegerField() # non-empty cells, the divisor of flowrate_sum
+    flowrate_sum = models.FloatField()
+    flowrate_min = models.FloatField(null=True)
+    flowrate_max = models.FloatField(null=True)
+    pressure_count = models.IntegerField()
+    pressure_sum = models.FloatField()
+    pressure_min = models.FloatField(null=True)
+    pressure_max = models.FloatField(null=True)
+    temperature_count = models.IntegerField()
+    temperature_sum = models.FloatField()
+    temperature_min = models.FloatField(null=True)
+    temperature_max = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['equipment_name', 'bucket_start']),
+        ]
@@ -0,0 +1,142 @@
+"""
+On-demand profiling of single requests.
+
+With CHEMVIZ_PROFILING_ENABLED on, a request from a staff user that carries
+an "X-Profile: 1" header runs under a profiler (ProfilingMiddleware in
+equipment/middleware.py). The profile is written to CHEMVIZ_PROFILE_DIR and
+recorded as a RequestProfile, which the Django admin lists. pyinstrument, a
+sampling profiler, is used when it is installed (an HTML flame view);
+otherwise cProfile (a .prof file for pstats or snakeviz).
+
+Only one request per process is profiled at a time; a second profiled
+request arriving meanwhile is served normally. Under ASGI a cProfile run also
+sees other requests interleaved on the event loop, so prefer pyinstrument
+there.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import RequestProfile
+
+try:
+    from pyinstrument import Profiler as SamplingProfiler
+except ImportError:  # pragma: no cover - depends on the environment
+    SamplingProfiler = None
+
+HEADER = "HTTP_X_PROFILE"
+
+_busy = threading.Lock()
+
+
+class CProfileRun:
+    name = "cprofile"
+    extension = "prof"
+
+    def __init__(self, is_async=False):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, path):
+        self.profile.dump_stats(path)
+
+    def summary(self):
+        out = io.StringIO()
+        pstats.Stats(self.profile, stream=out).sort_stats("cumulative").print_stats(40)
+        return out.getvalue()
+
+
+class SamplingRun:
+    name = "pyinstrument"
+    extension = "html"
+
+    def __init__(self, is_async=False):
+        self.profiler = SamplingProfiler(async_mode="enabled" if is_async else "disabled")
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.profiler.output_html())
+
+    def summary(self):
+        return self.profiler.output_text(unicode=False, color=False)
+
+
+def requested(request):
+    return request.META.get(HEADER, "").lower() in ("1", "true", "yes")
+
+
+def request_user(request):
+    """The staff user behind request (session or token), or None."""
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        # Token clients are only authenticated inside the DRF view
+        from rest_framework.exceptions import AuthenticationFailed
+
+        from .authentication import CachedTokenAuthentication
+
+        try:
+            result = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            result = None
+        user = result[0] if result else None
+    return user if user is not None and user.is_active and user.is_staff else None
+
+
+def begin(is_async=False):
+    """A started profiler run, or None if another request is being profiled."""
+    if not _busy.acquire(blocking=False):
+        return None
+    run = (SamplingRun if SamplingProfiler is not None else CProfileRun)(is_async)
+    try:
+        run.start()
+    except Exception:
+        _busy.release()
+        raise
+    return run
+
+
+def end(run):
+    try:
+        run.stop()
+    finally:
+        _busy.release()
+
+
+def save(run, request, response, user, duration):
+    """Write the profile to CHEMVIZ_PROFILE_DIR and record it; returns the RequestProfile."""
+    os.makedirs(settings.CHEMVIZ_PROFILE_DIR, exist_ok=True)
+    file_name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.{run.extension}"
+    run.save(os.path.join(settings.CHEMVIZ_PROFILE_DIR, file_name))
+    match = request.resolver_match
+    return RequestProfile.objects.create(
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[:255],
+        view_name=(match.view_name or "") if match else "",
+        status_code=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        profiler=run.name,
+        file_path=file_name,
+        summary=run.summary(),
+    )
+
+
+def profile_file(profile):
+    return os.path.join(settings.CHEMVIZ_PROFILE_DIR, profile.file_path)
@@ -0,0 +1,329 @@
+"""
+Ad-hoc filter / group-by / aggregate queries over stored uploads (POST /api/query/).
+
+A query names the uploads to look at (default: all), filters on the CSV
+columns, up to two group-by columns (Type, Equipment Name) and aggregates
+(count, sum, mean, min, max of a metric, or a row count):
+
+    {"filters": [{"column": "Type", "op": "==", "value": "Pump"},
+                 {"column": "Pressure", "op": ">", "value": 6}],
+     "group_by": ["Type"],
+     "aggregates": [{"func": "mean", "column": "Temperature"}, {"func": "count"}]}
+
+Uploads with a Parquet archive are scanned with pyarrow, reading only the
+columns the query uses and pushing the filters down to the row groups; the
+grouping and aggregation run vectorized in Arrow. Uploads without an archive
+are answered by one GROUP BY over their stored readings. Both produce
+mergeable partials (row count, and count/sum/min/max per metric), so a mean
+over a mix of sources is exact.
+
+Results are cached in-process, keyed on the normalized query and a revision
+of the uploads it covers (their number, largest id, row total, latest append,
+archives, and the latest retention rollup), so an upload, append or
+retention pass makes earlier results unreachable. Uploads whose readings were
+compacted by retention and whose archive is gone are reported as missing.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Count, Max, Min, Q, Sum
+
+from . import metrics
+from .archive import archive_dataset, archive_enabled, archive_file
+from .models import EquipmentReading, ReadingRollup, UploadHistory
+from .timing import stage
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:  # pragma: no cover - depends on the environment
+    ds = None
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+GROUP_COLUMNS = ["Type", "Equipment Name"]
+FIELDS = {
+    "Type": "equipment_type",
+    "Equipment Name": "equipment_name",
+    "Flowrate": "flowrate",
+    "Pressure": "pressure",
+    "Temperature": "temperature",
+}
+OPERATORS = ["==", "!=", "<", "<=", ">", ">=", "in"]
+FUNCS = ["count", "sum", "mean", "min", "max"]
+PARTS = ["count", "sum", "min", "max"]
+
+
+class QueryError(ValueError):
+    """A query the API cannot run; the message says why."""
+
+
+def _value(column, value):
+    if column in METRICS:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise QueryError(f"{column} filters need a number")
+        return float(value)
+    if not isinstance(value, str):
+        raise QueryError(f"{column} filters need a string")
+    return value
+
+
+def normalize(body):
+    """The query in canonical form (same question, same dict); raises QueryError."""
+    if not isinstance(body, dict):
+        raise QueryError("The query must be a JSON object")
+    unknown = set(body) - {"uploads", "filters", "group_by", "aggregates", "limit"}
+    if unknown:
+        raise QueryError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+
+    uploads = body.get("uploads")
+    if uploads is not None:
+        if not isinstance(uploads, list) or not all(isinstance(u, int) and not isinstance(u, bool) for u in uploads):
+            raise QueryError("uploads must be a list of upload ids")
+        uploads = sorted(set(uploads))
+
+    filters = []
+    for f in body.get("filters") or []:
+        if not isinstance(f, dict) or f.get("column") not in FIELDS or f.get("op") not in OPERATORS:
+            raise QueryError(f"Filters need a column ({', '.join(FIELDS)}) and an op ({', '.join(OPERATORS)})")
+        column, op = f["column"], f["op"]
+        if op == "in":
+            if not isinstance(f.get("value"), list) or not f["value"]:
+                raise QueryError("'in' filters need a non-empty list")
+            value = sorted({_value(column, v) for v in f["value"]})
+        else:
+            value = _value(column, f.get("value"))
+            if column not in METRICS and op not in ("==", "!="):
+                raise QueryError(f"{column} can only be compared with ==, != or in")
+        filters.append({"column": column, "op": op, "value": value})
+    filters.sort(key=lambda f: json.dumps(f, sort_keys=True))
+
+    group_by = body.get("group_by") or []
+    if not isinstance(group_by, list) or any(c not in GROUP_COLUMNS for c in group_by):
+        raise QueryError(f"group_by may only name {' and '.join(GROUP_COLUMNS)}")
+    group_by = [c for c in GROUP_COLUMNS if c in group_by]
+
+    aggregates = []
+    for a in body.get("aggregates") or [{"func": "count"}]:
+        if not isinstance(a, dict) or a.get("func") not in FUNCS:
+            raise QueryError(f"Aggregates need a func ({', '.join(FUNCS)})")
+        column = a.get("column")
+        if column is None and a["func"] != "count":
+            raise QueryError(f"{a['func']} needs a metric column")
+        if column is not None and column not in METRICS:
+            raise QueryError(f"Aggregates apply to {', '.join(METRICS)}")
+        aggregates.append({"func": a["func"], "column": column})
+    aggregates = sorted({json.dumps(a, sort_keys=True) for a in aggregates})
+    aggregates = [json.loads(a) for a in aggregates]
+
+    limit = body.get("limit", settings.CHEMVIZ_QUERY_MAX_GROUPS)
+    if isinstance(limit, bool) or not isinstance(limit, int) or limit < 1:
+        raise QueryError("limit must be a positive integer")
+    limit = min(limit, settings.CHEMVIZ_QUERY_MAX_GROUPS)
+
+    return {"uploads": uploads, "filters": filters, "group_by": group_by, "aggregates": aggregates, "limit": limit}
+
+
+def _uploads(query):
+    uploads = UploadHistory.objects.all()
+    if query["uploads"] is not None:
+        uploads = uploads.filter(pk__in=query["uploads"])
+    return uploads
+
+
+def revision(query):
+    """A string that changes whenever the data a query covers does."""
+    state = _uploads(query).aggregate(
+        uploads=Count("pk"),
+        last=Max("pk"),
+        rows=Sum("total_equipment"),
+        appended=Max("state__updated_at"),
+        archived=Count("pk", filter=~Q(archive_path="")),
+    )
+    state["rollup"] = ReadingRollup.objects.aggregate(last=Max("pk"))["last"]
+    return json.dumps(state, sort_keys=True, default=str)
+
+
+class QueryCache:
+    """Results by query key, least recently used first out."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key, result):
+        if settings.CHEMVIZ_QUERY_CACHE_SIZE <= 0:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.CHEMVIZ_QUERY_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = QueryCache()
+
+
+def _columns(query):
+    """Metric columns whose partials the query needs."""
+    return [m for m in METRICS if any(a["column"] == m for a in query["aggregates"])]
+
+
+def _arrow_partials(paths, query):
+    if not paths:
+        return {}
+    expr = None
+    for f in query["filters"]:
+        field, value = ds.field(f["column"]), f["value"]
+        term = {
+            "==": lambda: field == value,
+            "!=": lambda: field != value,
+            "<": lambda: field < value,
+            "<=": lambda: field <= value,
+            ">": lambda: field > value,
+            ">=": lambda: field >= value,
+            "in": lambda: field.isin(value),
+        }[f["op"]]()
+        expr = term if expr is None else expr & term
+
+    keys, columns = query["group_by"], _columns(query)
+    with stage("query_scan"):
+        table = archive_dataset(paths).to_table(columns=keys + columns, filter=expr)
+    with stage("query_aggregate"):
+        grouped = table.group_by(keys).aggregate(
+            [([], "count_all")] + [(m, part) for m in columns for part in PARTS]
+        ).to_pylist()
+
+    partials = {}
+    for row in grouped:
+        partials[tuple(row[k] for k in keys)] = {
+            "rows": row["count_all"],
+            **{m: {part: row[f"{m}_{part}"] for part in PARTS} for m in columns},
+        }
+    return partials
+
+
+def _orm_partials(upload_ids, query):
+    if not upload_ids:
+        return {}
+    readings = EquipmentReading.objects.filter(upload_id__in=upload_ids)
+    for f in query["filters"]:
+        field, value = FIELDS[f["column"]], f["value"]
+        if f["op"] == "!=":
+            # As in Arrow, a comparison with an empty cell never matches
+            readings = readings.filter(**{f"{field}__isnull": False}).exclude(**{field: value})
+        else:
+            lookup = {"==": "exact", "<": "lt", "<=": "lte", ">": "gt", ">=": "gte", "in": "in"}[f["op"]]
+            readings = readings.filter(**{f"{field}__{lookup}": value})
+
+    keys, columns = query["group_by"], _columns(query)
+    functions = {"count": Count, "sum": Sum, "min": Min, "max": Max}
+    annotations = {"rows": Count("pk")}
+    for m in columns:
+        for part in PARTS:
+            annotations[f"{m}_{part}"] = functions[part](FIELDS[m])
+    with stage("query_readings"):
+        grouped = readings.values(*[FIELDS[k] for k in keys]).annotate(**annotations).order_by()
+
+    partials = {}
+    for row in grouped:
+        if not row["rows"]:
+            continue  # an aggregate without GROUP BY returns one row even when nothing matched
+        partials[tuple(row[FIELDS[k]] for k in keys)] = {
+            "rows": row["rows"],
+            **{m: {part: row[f"{m}_{part}"] for part in PARTS} for m in columns},
+        }
+    return partials
+
+
+def _merge(target, partials):
+    for key, partial in partials.items():
+        current = target.get(key)
+        if current is None:
+            target[key] = partial
+            continue
+        current["rows"] += partial["rows"]
+        for m, parts in partial.items():
+            if m == "rows":
+                continue
+            mine = current[m]
+            mine["count"] += parts["count"]
+            mine["sum"] = (mine["sum"] or 0.0) + (parts["sum"] or 0.0)
+            for part, pick in (("min", min), ("max", max)):
+                values = [v for v in (mine[part], parts[part]) if v is not None]
+                mine[part] = pick(values) if values else None
+
+
+def _finish(partial, aggregate):
+    func, column = aggregate["func"], aggregate["column"]
+    if column is None:
+        return partial["rows"]
+    parts = partial[column]
+    if func == "mean":
+        return parts["sum"] / parts["count"] if parts["count"] else None
+    if func == "sum":
+        return parts["sum"] or 0.0
+    return parts[func]
+
+
+def execute(query):
+    """Run a normalized query (uncached); returns the result body."""
+    uploads = list(_uploads(query).only("pk", "archive_path").order_by("pk"))
+    archived, stored = [], []
+    for upload in uploads:
+        path = archive_file(upload) if archive_enabled() and ds is not None else None
+        if path is not None and os.path.exists(path):
+            archived.append((upload.pk, path))
+        else:
+            stored.append(upload.pk)
+
+    partials = {}
+    _merge(partials, _arrow_partials([path for _, path in archived], query))
+    _merge(partials, _orm_partials(stored, query))
+    with_readings = set(EquipmentReading.objects.filter(upload_id__in=stored).values_list("upload_id", flat=True)
+                        .distinct()) if stored else set()
+
+    groups = []
+    for key in sorted(partials, key=lambda k: tuple("" if v is None else str(v) for v in k)):
+        row = dict(zip(query["group_by"], key))
+        for a in query["aggregates"]:
+            name = a["func"] if a["column"] is None else f"{a['func']}_{a['column']}"
+            row[name] = _finish(partials[key], a)
+        groups.append(row)
+
+    return {
+        "groups": groups[:query["limit"]],
+        "truncated": len(groups) > query["limit"],
+        "sources": {
+            "archive": [pk for pk, _ in archived],
+            "readings": sorted(with_readings),
+            "missing": [pk for pk in stored if pk not in with_readings],
+        },
+    }
+
+
+def run(body):
+    """Normalize, then answer from the cache or execute; returns the result body."""
+    query = normalize(body)
+    rev = revision(query)
+    key = hashlib.sha256(json.dumps([query, rev], sort_keys=True).encode()).hexdigest()
+    result = cache.get(key)
+    hit = result is not None
+    metrics.record_cache("query", hit)
+    if not hit:
+        result = execute(query)
+        cache.put(key, result)
+    return {"query": query, **result, "cached": hit}
@@ -0,0 +1,51 @@
+"""
+Fast JSON rendering.
+
+DRF's JSONRenderer goes through the standard library encoder, which is slow
+on the large nested summaries (per-Type statistics, flagged rows) the API
+returns. ORJSONRenderer serializes with orjson when it is installed and
+falls back to JSONRenderer otherwise. Datetimes and anything orjson does not
+handle natively (Decimal, lazy translation strings, ...) are passed to DRF's
+encoder, so the output matches JSONRenderer's apart from whitespace; NaN and
+infinities become null instead of raising.
+"""
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def dumps(data, indent=False):
+    """data as UTF-8 JSON bytes, with orjson if available."""
+    if orjson is None:
+        return JSONRenderer().render(data, renderer_context={"indent": 2 if indent else None})
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, default=_encoder.default, option=option)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer backed by orjson (see the module docstring)."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        return dumps(data, indent=bool(indent))
+
+
+class JSONResponse(HttpResponse):
+    """JsonResponse for the async views, serialized with dumps()."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault("content_type", "application/json")
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,204 @@
+"""
+Retention: compaction of old readings and removal of old archives and uploads.
+
+One pass (run_retention, or the "retention" management command, which can
+also repeat passes with --loop) does, in order:
+
+  1. Readings recorded more than CHEMVIZ_RETENTION_RAW_DAYS ago, of uploads
+     received more than that ago, are folded into ReadingRollup rows (count,
+     sum, min and max per metric for each piece of equipment and
+     CHEMVIZ_RETENTION_BUCKET_SECONDS time bucket), then deleted. The series
+     API reads the rollups alongside raw readings. A new upload of
+     historical data is thus kept raw for the full period, and rows without
+     a Timestamp are recorded when they were received, so rows just
+     appended to an old upload are kept too.
+  2. Parquet archives of uploads older than CHEMVIZ_RETENTION_ARCHIVE_DAYS
+     are deleted and the uploads' archive_path cleared.
+  3. Uploads older than CHEMVIZ_RETENTION_HISTORY_DAYS are deleted outright
+     (with their appends and stored state; their rollups stay).
+  4. Resumable upload sessions not written to for CHEMVIZ_RETENTION_CHUNKED_DAYS
+     are deleted with their part files, whatever their status.
+
+A period of 0 skips that step. Each step works in batches of
+CHEMVIZ_RETENTION_BATCH_SIZE rows, one transaction per batch, so writers
+never wait on a long one. On PostgreSQL a batch skips rows another pass
+holds, so passes in several processes can overlap safely; on SQLite write
+transactions are serialized anyway.
+"""
+import logging
+import time
+from datetime import timedelta
+from functools import partial
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from . import chunked
+from .archive import archive_file, remove_on_commit
+from .models import ChunkedUpload, EquipmentReading, ReadingRollup, UploadHistory
+
+logger = logging.getLogger("chemviz.retention")
+
+METRIC_FIELDS = ["flowrate", "pressure", "temperature"]
+
+
+def cutoff(days, now=None):
+    """Datetime before which data older than days is out of retention, or None for 0 (keep forever)."""
+    if not days:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def _locked(queryset):
+    # Skip rows a concurrent pass is working on (PostgreSQL); a no-op on SQLite
+    features = connection.features
+    if features.has_select_for_update_skip_locked and features.has_select_for_update_of:
+        return queryset.select_for_update(skip_locked=True, of=("self",))
+    return queryset
+
+
+def rollups(rows, bucket_seconds):
+    """ReadingRollup instances (unsaved) for rows of (name, type, recorded_at, flowrate, pressure, temperature)."""
+    df = pd.DataFrame(rows, columns=["equipment_name", "equipment_type", "recorded_at"] + METRIC_FIELDS)
+    times = pd.to_datetime(df["recorded_at"], utc=True)
+    df["bucket_start"] = times.dt.floor(f"{bucket_seconds}s")
+    df[METRIC_FIELDS] = df[METRIC_FIELDS].astype(float)
+    grouped = df.groupby(["equipment_name", "equipment_type", "bucket_start"], sort=False)
+    stats = grouped[METRIC_FIELDS].agg(["count", "sum", "min", "max"])
+    stats.columns = [f"{m}_{agg}" for m, agg in stats.columns]
+    stats["count"] = grouped.size()
+    stats = stats.reset_index()
+    # Empty min/max -> NULL; counts and sums of an empty metric are 0 already
+    records = stats.astype(object).where(stats.notna(), None).to_dict("records")
+    for record in records:
+        record["bucket_start"] = record["bucket_start"].to_pydatetime()
+    return [ReadingRollup(bucket_seconds=bucket_seconds, **record) for record in records]
+
+
+def compact_readings(before, batch_size, bucket_seconds, dry_run=False):
+    """Fold readings recorded before `before` in uploads older than it into rollups; returns (readings, rollups)."""
+    old = EquipmentReading.objects.filter(recorded_at__lt=before, upload__created_at__lt=before)
+    if dry_run:
+        return old.count(), 0
+    readings = created = 0
+    while True:
+        with transaction.atomic():
+            rows = list(_locked(old.order_by("pk")).values_list(
+                "pk", "equipment_name", "equipment_type", "recorded_at", *METRIC_FIELDS)[:batch_size])
+            if not rows:
+                break
+            batch = rollups([r[1:] for r in rows], bucket_seconds)
+            ReadingRollup.objects.bulk_create(batch)
+            EquipmentReading.objects.filter(pk__in=[r[0] for r in rows]).delete()
+        readings += len(rows)
+        created += len(batch)
+    return readings, created
+
+
+def remove_archive(upload):
+    """Delete upload's archive once the batch that clears or deletes the upload commits."""
+    path = archive_file(upload)
+    if path is not None:
+        remove_on_commit(path)
+
+
+def delete_archives(before, batch_size, dry_run=False):
+    """Delete the archives of uploads created before `before`; returns how many."""
+    old = UploadHistory.objects.filter(created_at__lt=before).exclude(archive_path="")
+    if dry_run:
+        return old.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            uploads = list(_locked(old.order_by("pk").only("pk", "archive_path"))[:batch_size])
+            if not uploads:
+                break
+            for upload in uploads:
+                remove_archive(upload)
+            UploadHistory.objects.filter(pk__in=[u.pk for u in uploads]).update(archive_path="")
+        deleted += len(uploads)
+    return deleted
+
+
+def delete_uploads(before, batch_size, dry_run=False):
+    """Delete uploads created before `before` (their readings too); returns how many."""
+    old = UploadHistory.objects.filter(created_at__lt=before)
+    if dry_run:
+        return old.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            uploads = list(_locked(old.order_by("pk").only("pk", "archive_path"))[:batch_size])
+            if not uploads:
+                break
+            for upload in uploads:
+                remove_archive(upload)
+            UploadHistory.objects.filter(pk__in=[u.pk for u in uploads]).delete()
+        deleted += len(uploads)
+    return deleted
+
+
+def expire_chunked_uploads(before, batch_size, dry_run=False):
+    """Delete resumable upload sessions last written to before `before`, and their part files; returns how many."""
+    old = ChunkedUpload.objects.filter(updated_at__lt=before)
+    if dry_run:
+        return old.count()
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            sessions = list(_locked(old.order_by("pk").only("pk"))[:batch_size])
+            if not sessions:
+                break
+            for session in sessions:
+                transaction.on_commit(partial(chunked.remove_part, session))
+            ChunkedUpload.objects.filter(pk__in=[s.pk for s in sessions]).delete()
+        deleted += len(sessions)
+    return deleted
+
+
+def run_retention(raw_days=None, archive_days=None, history_days=None, chunked_days=None, batch_size=None,
+                  dry_run=False):
+    """One retention pass with the settings (or the given overrides); returns what it did, by step."""
+    def option(value, name):
+        return getattr(settings, name) if value is None else value
+
+    now = timezone.now()
+    batch_size = option(batch_size, "CHEMVIZ_RETENTION_BATCH_SIZE")
+    started = time.perf_counter()
+    result = {"dry_run": dry_run}
+
+    before = cutoff(option(raw_days, "CHEMVIZ_RETENTION_RAW_DAYS"), now)
+    if before is not None:
+        bucket_seconds = settings.CHEMVIZ_RETENTION_BUCKET_SECONDS
+        result["readings_compacted"], result["rollups_created"] = compact_readings(
+            before, batch_size, bucket_seconds, dry_run)
+
+    before = cutoff(option(archive_days, "CHEMVIZ_RETENTION_ARCHIVE_DAYS"), now)
+    if before is not None:
+        result["archives_deleted"] = delete_archives(before, batch_size, dry_run)
+
+    before = cutoff(option(history_days, "CHEMVIZ_RETENTION_HISTORY_DAYS"), now)
+    if before is not None:
+        result["uploads_deleted"] = delete_uploads(before, batch_size, dry_run)
+
+    before = cutoff(option(chunked_days, "CHEMVIZ_RETENTION_CHUNKED_DAYS"), now)
+    if before is not None:
+        result["chunked_uploads_expired"] = expire_chunked_uploads(before, batch_size, dry_run)
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def run_forever(interval, **options):
+    """Run a retention pass (with run_retention's options) every interval seconds, until interrupted."""
+    while True:
+        try:
+            logger.info("retention pass: %s", run_retention(**options))
+        except Exception:
+            logger.exception("retention pass failed")
+        finally:
+            # Don't hold connections open between passes
+            connections.close_all()
+        time.sleep(interval)
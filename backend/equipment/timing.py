@@ -0,0 +1,75 @@
+"""
+Per-request stage timing.
+
+TimingMiddleware (equipment/middleware.py) opens a collector for each
+request; code on the hot path wraps its stages in stage("name") (or
+clock()/record() where a block is too long to indent). Without an open
+collector a stage costs one context-variable lookup. Like ingest.py this
+module does not touch Django, so parse workers can import it.
+
+Stages that run in a parse worker process are not collected; the parent
+records the time it waits for the pool as "parse_pool".
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("chemviz_timings", default=None)
+
+clock = time.perf_counter
+
+
+class Timings:
+    """Accumulated milliseconds (and call counts) per stage name, in first-seen order."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, name, seconds):
+        entry = self.stages.setdefault(name, [0.0, 0])
+        entry[0] += seconds * 1000
+        entry[1] += 1
+
+    def header(self, total_ms):
+        parts = [f"{name};dur={ms:.1f}" for name, (ms, _) in self.stages.items()]
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+    def as_dict(self):
+        return {name: {"ms": round(ms, 2), "count": count} for name, (ms, count) in self.stages.items()}
+
+
+def record(name, started):
+    """Add the time since started (a clock() value) to stage name; returns it in seconds."""
+    elapsed = clock() - started
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, elapsed)
+    return elapsed
+
+
+@contextmanager
+def stage(name):
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = clock()
+    try:
+        yield
+    finally:
+        timings.add(name, clock() - started)
+
+
+def start():
+    """Open a collector for the current context; returns (timings, token for finish())."""
+    timings = Timings()
+    return timings, _current.set(timings)
+
+
+def finish(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
@@ -0,0 +1,68 @@
+"""
+Disk-backed upload handling.
+
+Django's default handlers keep small files in memory and spool larger ones
+to a temporary file, and ingestion then read() the whole file back into a
+bytes object before pandas parsed it again through a BytesIO. With
+HashingUploadHandler (FILE_UPLOAD_HANDLERS) every uploaded file is written
+once, as it arrives, to a temporary file in FILE_UPLOAD_TEMP_DIR, and its
+SHA-256 is computed on the same pass. Ingestion hands that path to pandas
+with memory_map=True (see ingest.expand_uploads), so the CSV bytes are not
+copied through Python buffers again. The file is deleted when the request
+ends.
+
+A request whose body exceeds CHEMVIZ_UPLOAD_MAX_BYTES is refused with
+UploadTooLarge: from its Content-Length before anything is read, or as soon
+as the received bytes pass the limit otherwise. 0 disables the limit.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+
+class UploadTooLarge(RequestDataTooBig):
+    """An upload over CHEMVIZ_UPLOAD_MAX_BYTES; the views answer 413."""
+
+    def __init__(self, limit):
+        super().__init__(f"Uploads are limited to {limit} bytes")
+        self.limit = limit
+
+
+class HashingUploadHandler(FileUploadHandler):
+    """Writes each file straight to a temporary file, hashing it on the way (file.sha256)."""
+
+    chunk_size = 1024 * 1024
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.limit = settings.CHEMVIZ_UPLOAD_MAX_BYTES
+        self.received = 0
+        if self.limit and content_length > self.limit:
+            raise UploadTooLarge(self.limit)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset,
+                                          self.content_type_extra)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.limit and self.received > self.limit:
+            self.upload_interrupted()
+            raise UploadTooLarge(self.limit)
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            # Closing the temporary file deletes it
+            self.file.close()
@@ -0,0 +1,150 @@
+"""
+Validation and cleaning of uploaded CSV frames, ahead of aggregation.
+
+Every step works on whole columns: headers are matched case- and
+whitespace-insensitively, metric cells are coerced with
+pd.to_numeric(errors="coerce"), values outside the physically valid range
+are masked to NaN (so they count like empty cells), and Type strings are
+trimmed and folded to one spelling per case-insensitive name. Rows without a
+Type are rejected. What was masked or rejected is summed up in a compact
+report with a few example cells, so a bad file explains itself without
+growing the response. Like ingest.py, this module does not touch Django.
+"""
+import numpy as np
+import pandas as pd
+
+METRICS = ["Flowrate", "Pressure", "Temperature"]
+REQUIRED_COLUMNS = ["Type"] + METRICS
+KNOWN_COLUMNS = ["Equipment Name", "Timestamp"] + REQUIRED_COLUMNS
+
+EXAMPLE_LIMIT = 20
+
+
+class ValidationError(ValueError):
+    """A file that cannot be ingested at all (e.g. a required column is missing)."""
+
+    def __init__(self, message, missing=()):
+        super().__init__(message)
+        self.missing = list(missing)
+
+    def __reduce__(self):
+        # Keep `missing` when raised in a parse worker process
+        return type(self), (str(self), self.missing)
+
+
+def empty_report():
+    return {
+        "rows_rejected": 0,
+        "rejected_by_reason": {},
+        "cells_masked": {m: {"non_numeric": 0, "out_of_range": 0} for m in METRICS},
+        "examples": [],
+    }
+
+
+def merge_reports(target, report):
+    target["rows_rejected"] += report["rows_rejected"]
+    for reason, n in report["rejected_by_reason"].items():
+        target["rejected_by_reason"][reason] = target["rejected_by_reason"].get(reason, 0) + n
+    for m in METRICS:
+        for reason, n in report["cells_masked"][m].items():
+            target["cells_masked"][m][reason] += n
+    room = EXAMPLE_LIMIT - len(target["examples"])
+    target["examples"].extend(report["examples"][:max(room, 0)])
+    return target
+
+
+def header_mapping(columns, name=""):
+    """Renames that bring known columns to their canonical spelling; raises ValidationError if one is missing."""
+    canonical = {" ".join(c.split()).lower(): c for c in KNOWN_COLUMNS}
+    renames = {}
+    for column in columns:
+        key = " ".join(str(column).split()).lower()
+        if key in canonical and column != canonical[key]:
+            renames[column] = canonical[key]
+    present = {renames.get(c, c) for c in columns}
+    missing = [c for c in REQUIRED_COLUMNS if c not in present]
+    if missing:
+        prefix = f"{name}: " if name else ""
+        raise ValidationError(f"{prefix}missing required column(s): {', '.join(missing)}", missing)
+    return renames
+
+
+class Validator:
+    """
+    Cleans the frames (or chunks) of one file in order. Type spellings seen in
+    earlier chunks are kept, so every chunk folds case variants the same way.
+    """
+
+    def __init__(self, name="", valid_ranges=None):
+        self.name = name
+        self.valid_ranges = valid_ranges or {}
+        self.renames = None
+        self.type_names = {}
+        self.report = empty_report()
+
+    def clean(self, df):
+        """The valid rows of df, cleaned; what was dropped or masked goes into self.report."""
+        if self.renames is None:
+            self.renames = header_mapping(df.columns, self.name)
+        if self.renames:
+            df = df.rename(columns=self.renames)
+        df = df.copy()
+        # CSV line of each row: the header is line 1 and the index runs on across chunks
+        lines = df.index.to_numpy() + 2
+
+        for m in METRICS:
+            raw = df[m]
+            values = pd.to_numeric(raw, errors="coerce")
+            non_numeric = (values.isna() & raw.notna()).to_numpy()
+            if raw.dtype == object:
+                # Blank strings are empty cells, not bad ones
+                non_numeric &= raw.astype(str).str.strip().ne("").to_numpy()
+            low, high = self.valid_ranges.get(m, (None, None))
+            out_of_range = np.zeros(len(df), dtype=bool)
+            if low is not None:
+                out_of_range |= (values < low).to_numpy()
+            if high is not None:
+                out_of_range |= (values > high).to_numpy()
+            self._count_cells(m, "non_numeric", non_numeric, raw, lines)
+            self._count_cells(m, "out_of_range", out_of_range, raw, lines)
+            df[m] = values.mask(out_of_range).astype(float)
+
+        # Type names are few: normalise each distinct value once, then index by code
+        codes, uniques = pd.factorize(df["Type"])
+        names = pd.Series(uniques, dtype=object).astype(str).str.strip().str.replace(r"\s+", " ", regex=True)
+        for key, spelling in zip(names.str.lower().tolist(), names.tolist()):
+            if spelling:
+                self.type_names.setdefault(key, spelling)
+        folded = np.array([self.type_names.get(n.lower(), "") for n in names.tolist()] + [""], dtype=object)
+        types = folded[codes]  # code -1 (missing) picks the trailing ""
+        missing_type = types == ""
+        if missing_type.any():
+            self._reject("missing_type", missing_type, df["Type"], lines)
+            df, types = df[~missing_type], types[~missing_type]
+        df["Type"] = types
+        return df
+
+    def _count_cells(self, column, reason, mask, raw, lines):
+        n = int(mask.sum())
+        if n:
+            self.report["cells_masked"][column][reason] += n
+            self._examples(column, reason, mask, raw, lines)
+
+    def _reject(self, reason, mask, raw, lines):
+        n = int(mask.sum())
+        self.report["rows_rejected"] += n
+        self.report["rejected_by_reason"][reason] = self.report["rejected_by_reason"].get(reason, 0) + n
+        self._examples("Type", reason, mask, raw, lines)
+
+    def _examples(self, column, reason, mask, raw, lines):
+        room = EXAMPLE_LIMIT - len(self.report["examples"])
+        if room <= 0:
+            return
+        for i in np.flatnonzero(mask)[:room]:
+            value = raw.iloc[i]
+            self.report["examples"].append({
+                "line": int(lines[i]),
+                "column": column,
+                "value": None if pd.isna(value) else str(value),
+                "reason": reason,
+            })
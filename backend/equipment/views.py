@@ -1,4 +1,14 @@
-from django.http import HttpResponse
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import HttpResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from docx import Document
@@ -14,60 +24,668 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY, TA_LEFT
 from reportlab.pdfgen import canvas
 from io import BytesIO
+from itertools import islice
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
+import numpy as np
 import pandas as pd
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework.authtoken.models import Token
 
-from .models import UploadHistory
+from .archive import ArchiveWriter, archive_enabled, archive_file, read_archive
+from .authentication import issue_token
+from .compare import compare_uploads
+from .downsample import METHODS as DOWNSAMPLE_METHODS
+from . import admission, chunked, events, export, metrics, query, timing
+from .ingest import (
+    METRICS, MemberTooLarge, expand_uploads, finalize_summary, merge_partials, parse_many, partial_aggregate,
+    partial_from_state, partial_to_state,
+)
+from .models import ChunkedUpload, EquipmentReading, ReadingRollup, UploadAppend, UploadHistory, UploadState
+from .storage import SUMMARY_FIELDS, UploadSink, apply_summary
+from .uploads import UploadTooLarge
+from .validation import ValidationError
+
+
+logger = logging.getLogger("chemviz.views")
+
+ROLLUP_METRICS = ["flowrate", "pressure", "temperature"]
+
+# Time buckets the series API averages readings into when there are too many
+# to fetch, finest first, with each one's longest duration in seconds
+SERIES_BUCKETS = [
+    ("second", 1), ("minute", 60), ("hour", 3600), ("day", 86400), ("week", 7 * 86400),
+    ("month", 31 * 86400), ("year", 366 * 86400),
+]
+
+
+def anomaly_options():
+    return {
+        "envelopes": settings.CHEMVIZ_OPERATING_ENVELOPES,
+        "z_threshold": settings.CHEMVIZ_ANOMALY_Z_THRESHOLD,
+        "iqr_k": settings.CHEMVIZ_ANOMALY_IQR_K,
+        "row_limit": settings.CHEMVIZ_ANOMALY_ROW_LIMIT,
+    }
+
+
+def parse_options():
+    return {
+        "stream_threshold": settings.CHEMVIZ_STREAM_THRESHOLD_BYTES,
+        "chunk_rows": settings.CHEMVIZ_STREAM_CHUNK_ROWS,
+        "anomaly_options": anomaly_options(),
+        "valid_ranges": settings.CHEMVIZ_VALID_RANGES,
+    }
+
+
+def progress_reporter(user_id):
+    def report(record, rows):
+        events.publish("upload-progress", {
+            "stage": "parsing", "id": record.pk, "name": record.file_name, "rows": rows,
+        }, user_id=user_id)
+    return report
+
+
+def rejected_upload(error, user_id):
+    """Announce a file that failed validation; returns the 400 response (the caller rolls back)."""
+    events.publish("upload-progress", {"stage": "failed", "error": str(error)}, user_id=user_id)
+    transaction.set_rollback(True)
+    body = {"error": str(error)}
+    if error.missing:
+        body["missing_columns"] = error.missing
+    return Response(body, status=400)
+
+
+def count_upload(uploads, files, rows, parse_seconds):
+    metrics.upload_bytes.inc(sum(f.size for f in uploads))
+    metrics.upload_files.inc(files)
+    metrics.upload_rows.inc(rows)
+    if parse_seconds > 0:
+        metrics.parse_throughput.observe(rows / parse_seconds)
+
+
+def too_busy(error):
+    """Response for a request turned away by admission control; only a 413 is not worth retrying."""
+    if error.status == 413:
+        return Response({"error": str(error)}, status=413)
+    return Response({"error": str(error)}, status=error.status,
+                    headers={"Retry-After": str(settings.CHEMVIZ_UPLOAD_RETRY_AFTER_SECONDS)})
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_csv(request):
-    file = request.FILES['file']
-    df = pd.read_csv(file)
-
-    summary = {
-        "total_equipment": len(df),
-        "avg_flowrate": float(df["Flowrate"].mean()),
-        "avg_pressure": float(df["Pressure"].mean()),
-        "avg_temperature": float(df["Temperature"].mean()),
-        "type_distribution": df["Type"].value_counts().to_dict()
+    # The slot is taken before the body is read, so a busy server turns uploads
+    # away at once; memory is reserved once the files are on disk
+    try:
+        with admission.admit(request.user.pk) as slot:
+            return receive_upload(request, slot)
+    except admission.Rejected as e:
+        return too_busy(e)
+
+
+def receive_upload(request, slot):
+    # Accept a single file, several files, or ZIP archives of CSVs in one request;
+    # reading request.FILES is what writes them to disk (uploads.HashingUploadHandler)
+    try:
+        uploads = request.FILES.getlist('file') + request.FILES.getlist('files')
+    except UploadTooLarge as e:
+        return Response({"error": str(e)}, status=413)
+    if not uploads:
+        return Response({"error": "No file uploaded"}, status=400)
+    slot.reserve(admission.upload_sizes(uploads))
+    expected = request.data.get('sha256')
+    if expected:
+        if len(uploads) != 1 or not hasattr(uploads[0], 'sha256'):
+            return Response({"error": "sha256 can only be checked for a single file"}, status=400)
+        if uploads[0].sha256 != str(expected).lower():
+            return Response({"error": "File checksum mismatch"}, status=400)
+    append_to = request.data.get('append_to') or request.query_params.get('append_to')
+    if append_to and not str(append_to).isdigit():
+        return Response({"error": "append_to must be an upload id"}, status=400)
+    return ingest_files(uploads, request.user.pk, append_to, settings.CHEMVIZ_UPLOAD_MAX_BYTES)
+
+
+def ingest_files(uploads, user_id, append_to, max_bytes):
+    """
+    Expand uploaded files (with name and read()) and ingest them, or append
+    them to upload append_to. ZIP members over max_bytes are refused with 413;
+    the rest are extracted to a temporary directory, removed once parsed.
+    """
+    with tempfile.TemporaryDirectory(dir=settings.FILE_UPLOAD_TEMP_DIR) as extract_dir:
+        try:
+            with timing.stage("expand"):
+                members = expand_uploads(uploads, extract_dir, max_bytes)
+        except MemberTooLarge as e:
+            return Response({"error": str(e)}, status=413)
+        if not members:
+            return Response({"error": "No CSV files found in upload"}, status=400)
+        if append_to:
+            return append_uploads(uploads, members, int(append_to), user_id)
+        return ingest_uploads(uploads, members, user_id)
+
+
+def ingest_uploads(uploads, members, user_id):
+    """Parse, store and announce the (name, data) CSV members of uploads; returns the upload response."""
+    # Rows are created up front so readings can reference them while parsing;
+    # the summaries are filled in with one UPDATE once every file is parsed
+    with transaction.atomic():
+        create_started = timing.clock()
+        records = UploadHistory.objects.bulk_create([
+            UploadHistory(
+                file_name=name[:255],
+                total_equipment=0,
+                avg_flowrate=0,
+                avg_pressure=0,
+                avg_temperature=0,
+                type_distribution='{}'
+            )
+            for name, _ in members
+        ])
+        timing.record("db_create", create_started)
+        events.publish("upload-progress", {
+            "stage": "received",
+            "files": [{"id": r.pk, "name": r.file_name} for r in records],
+        }, user_id=user_id)
+
+        report = progress_reporter(user_id)
+        sinks = [
+            UploadSink(
+                record,
+                store_rows=settings.CHEMVIZ_STORE_READINGS,
+                archive=ArchiveWriter(record) if archive_enabled() else None,
+                progress=report,
+            )
+            for record in records
+        ]
+
+        parse_started = timing.clock()
+        try:
+            parsed = parse_many(members, settings.CHEMVIZ_PARSE_WORKERS, sinks=sinks, **parse_options())
+            for sink in sinks:
+                sink.close()
+            parse_seconds = timing.clock() - parse_started
+        except ValidationError as e:
+            for sink in sinks:
+                sink.abort()
+            # Nothing of this request is kept, not even the placeholder rows
+            return rejected_upload(e, user_id)
+        except Exception as e:
+            for sink in sinks:
+                sink.abort()
+            events.publish("upload-progress", {"stage": "failed", "error": str(e)}, user_id=user_id)
+            raise
+
+        files = []
+        with timing.stage("finalize"):
+            for record, (name, partial) in zip(records, parsed):
+                file_summary = finalize_summary(partial)
+                apply_summary(record, file_summary)
+                files.append({"id": record.pk, "name": name, "summary": file_summary})
+        with timing.stage("db_update"):
+            UploadHistory.objects.bulk_update(records, SUMMARY_FIELDS + ['archive_path'])
+            # Kept so files can later be appended to each upload (append_uploads)
+            UploadState.objects.bulk_create([
+                UploadState(upload=record, state=partial_to_state(partial))
+                for record, (_, partial) in zip(records, parsed)
+            ])
+        transaction.on_commit(lambda: announce_uploads(records, user_id))
+        commit_started = timing.clock()
+    timing.record("db_commit", commit_started)
+
+    count_upload(uploads, len(records), sum(record.total_equipment for record in records), parse_seconds)
+
+    with timing.stage("finalize"):
+        merged = merge_partials((partial for _, partial in parsed), settings.CHEMVIZ_ANOMALY_ROW_LIMIT)
+        summary = finalize_summary(merged)
+
+    body = {"summary": summary}
+    if len(files) > 1:
+        body["files"] = files
+    else:
+        body["id"] = files[0]["id"]
+    return Response(body)
+
+
+def stored_partial(upload):
+    """
+    The mergeable aggregate behind an upload's summary. Uploads from before
+    append mode have no stored state; theirs is rebuilt once from the archive
+    (None if there is none).
+    """
+    state = UploadState.objects.filter(upload=upload).first()
+    if state is not None:
+        return partial_from_state(state.state)
+    table = read_archive(upload)
+    if table is None:
+        return None
+    with timing.stage("rebuild_state"):
+        return partial_aggregate(table.to_pandas(), exact=False, anomaly_options=anomaly_options())
+
+
+def append_uploads(uploads, members, upload_id, user_id):
+    """
+    Parse the (name, data) CSV members of uploads and fold their rows into an
+    existing upload: the new rows' partial aggregate is merged with the stored
+    one, so the cost is that of the new rows only. Each file is recorded as an
+    UploadAppend.
+    """
+    with transaction.atomic():
+        # Appends to one upload queue here, so none is merged into a stale state
+        target = UploadHistory.objects.select_for_update().filter(pk=upload_id).first()
+        if target is None:
+            return Response({"error": f"Upload {upload_id} not found"}, status=404)
+        base = stored_partial(target)
+        if base is None:
+            return Response({"error": f"Upload {upload_id} has no stored aggregate or archive to append to"},
+                            status=409)
+        events.publish("upload-progress", {
+            "stage": "received",
+            "files": [{"id": target.pk, "name": target.file_name}],
+        }, user_id=user_id)
+
+        # The archive is only extended if the upload has one to begin with
+        path = archive_file(target)
+        archive = None
+        if archive_enabled() and path is not None and os.path.exists(path):
+            archive = ArchiveWriter(target, keep_existing=True)
+        received_at = timezone.now()
+        report = progress_reporter(user_id)
+        sinks = [
+            UploadSink(target, store_rows=settings.CHEMVIZ_STORE_READINGS, archive=archive,
+                       progress=report, received_at=received_at)
+            for _ in members
+        ]
+
+        parse_started = timing.clock()
+        try:
+            parsed = parse_many(members, settings.CHEMVIZ_PARSE_WORKERS, sinks=sinks, **parse_options())
+            if archive is not None:
+                archive.close()
+            parse_seconds = timing.clock() - parse_started
+        except ValidationError as e:
+            if archive is not None:
+                archive.abort()
+            return rejected_upload(e, user_id)
+        except Exception as e:
+            if archive is not None:
+                archive.abort()
+            events.publish("upload-progress", {"stage": "failed", "error": str(e)}, user_id=user_id)
+            raise
+
+        total_before = base["count"]
+        with timing.stage("finalize"):
+            merged = merge_partials([base] + [partial for _, partial in parsed], settings.CHEMVIZ_ANOMALY_ROW_LIMIT)
+            summary = finalize_summary(merged)
+            apply_summary(target, summary)
+        with timing.stage("db_update"):
+            target.save(update_fields=SUMMARY_FIELDS + ['archive_path'])
+            UploadState.objects.update_or_create(upload=target, defaults={"state": partial_to_state(merged)})
+            appends = []
+            total = total_before
+            for name, partial in parsed:
+                appends.append(UploadAppend(
+                    upload=target, user_id=user_id, file_name=name[:255], rows=partial["count"],
+                    total_before=total, total_after=total + partial["count"], validation=partial["validation"],
+                ))
+                total += partial["count"]
+            UploadAppend.objects.bulk_create(appends)
+        transaction.on_commit(lambda: announce_uploads([target], user_id))
+        commit_started = timing.clock()
+    timing.record("db_commit", commit_started)
+
+    count_upload(uploads, len(parsed), total - total_before, parse_seconds)
+    return Response({
+        "id": target.pk,
+        "summary": summary,
+        "append": {
+            "files": [{"name": a.file_name, "rows": a.rows} for a in appends],
+            "rows_added": total - total_before,
+            "total_before": total_before,
+            "total_after": total,
+        },
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def upload_appends(request, upload_id):
+    """Files appended to an upload, oldest first"""
+    if not UploadHistory.objects.filter(pk=upload_id).exists():
+        return Response({"error": f"Upload {upload_id} not found"}, status=404)
+    return Response([
+        {
+            "file_name": a.file_name,
+            "rows": a.rows,
+            "total_before": a.total_before,
+            "total_after": a.total_after,
+            "validation": a.validation,
+            "user": a.user.username if a.user else None,
+            "time": a.created_at.isoformat(),
+        }
+        for a in UploadAppend.objects.filter(upload_id=upload_id).select_related('user')
+    ])
+
+
+def chunked_status(session):
+    return {
+        "id": session.pk,
+        "file_name": session.file_name,
+        "size": session.size,
+        "offset": session.offset,
+        "status": session.status,
+        "upload_id": session.upload_id,
     }
 
-    UploadHistory.objects.create(
-        total_equipment=summary["total_equipment"],
-        avg_flowrate=summary["avg_flowrate"],
-        avg_pressure=summary["avg_pressure"],
-        avg_temperature=summary["avg_temperature"],
-        type_distribution=str(summary["type_distribution"])
-    )
 
-    return Response({"summary": summary})
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_init(request):
+    """Start a resumable upload of a file of `size` bytes"""
+    file_name = str(request.data.get("file_name", "")).strip()
+    try:
+        size = int(request.data.get("size"))
+    except (TypeError, ValueError):
+        size = 0
+    if not file_name or size <= 0:
+        return Response({"error": "file_name and a positive size are required"}, status=400)
+    # Requests are capped by CHEMVIZ_UPLOAD_MAX_BYTES; resumable uploads exist for larger files
+    if settings.CHEMVIZ_CHUNKED_UPLOAD_MAX_BYTES and size > settings.CHEMVIZ_CHUNKED_UPLOAD_MAX_BYTES:
+        return Response({"error": str(UploadTooLarge(settings.CHEMVIZ_CHUNKED_UPLOAD_MAX_BYTES))}, status=413)
+
+    session = ChunkedUpload.objects.create(user=request.user, file_name=file_name[:255], size=size)
+    chunked.create_part(session)
+    return Response({**chunked_status(session), "chunk_size": settings.CHEMVIZ_UPLOAD_CHUNK_BYTES}, status=201)
+
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_detail(request, session_id):
+    """
+    GET: progress of a resumable upload, to resume from `offset`.
+    PUT ?offset=N: append the raw request body at byte N, which must be the
+    current offset; an optional X-Chunk-SHA256 header is checked first.
+    """
+    session = ChunkedUpload.objects.filter(pk=session_id, user=request.user).first()
+    if session is None:
+        return Response({"error": "Upload not found"}, status=404)
+    if request.method == 'GET':
+        return Response(chunked_status(session))
+
+    if session.status != ChunkedUpload.UPLOADING:
+        return Response({"error": f"Upload is {session.status}", **chunked_status(session)}, status=409)
+    try:
+        offset = int(request.query_params["offset"])
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (KeyError, ValueError):
+        return Response({"error": "offset must be given as an integer"}, status=400)
+    if offset != session.offset:
+        return Response({"error": "Chunk is not at the current offset", **chunked_status(session)}, status=409)
+    if length <= 0 or offset + length > session.size:
+        return Response({"error": "Chunk must be non-empty and end within the file size"}, status=400)
+    if length > settings.CHEMVIZ_UPLOAD_CHUNK_MAX_BYTES:
+        return Response({"error": f"Chunks are limited to {settings.CHEMVIZ_UPLOAD_CHUNK_MAX_BYTES} bytes"},
+                        status=413)
+
+    # Claim the offset before writing, so concurrent PUTs for it cannot
+    # interleave their bytes; a claim older than the chunk timeout is abandoned
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.CHEMVIZ_UPLOAD_CHUNK_TIMEOUT_SECONDS)
+    claimed = ChunkedUpload.objects.filter(
+        Q(writing_since__isnull=True) | Q(writing_since__lt=stale),
+        pk=session.pk, offset=offset, status=ChunkedUpload.UPLOADING,
+    ).update(writing_since=now, updated_at=now)
+    if not claimed:
+        session.refresh_from_db()
+        return Response({"error": "Another chunk is being written at this offset", **chunked_status(session)},
+                        status=409)
+
+    mine = ChunkedUpload.objects.filter(pk=session.pk, writing_since=now)
+    error = None
+    advanced = 0
+    try:
+        chunked.write_chunk(session, offset, request.stream, length, request.headers.get("X-Chunk-SHA256"))
+        advanced = mine.update(offset=offset + length, writing_since=None, updated_at=timezone.now())
+    except chunked.ChunkError as e:
+        error = e
+    finally:
+        if not advanced:
+            mine.update(writing_since=None)
+    session.refresh_from_db()
+    if error is not None:
+        return Response({"error": str(error), **chunked_status(session)}, status=400)
+    if not advanced:
+        # Our claim went stale and another PUT took the offset over
+        return Response({"error": "Chunk is not at the current offset", **chunked_status(session)}, status=409)
+    return Response(chunked_status(session))
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def chunked_upload_finalize(request, session_id):
+    """Ingest a completely received resumable upload like a POST to /api/upload/ (append_to included)"""
+    session = ChunkedUpload.objects.filter(pk=session_id, user=request.user).first()
+    if session is None:
+        return Response({"error": "Upload not found"}, status=404)
+    if session.offset != session.size:
+        return Response({"error": "Upload is incomplete", **chunked_status(session)}, status=409)
+    append_to = request.data.get("append_to")
+    if append_to and not str(append_to).isdigit():
+        return Response({"error": "append_to must be an upload id"}, status=400)
+    try:
+        with admission.admit(request.user.pk, [(session.size, True)]):
+            return finalize_chunked(request, session, append_to)
+    except admission.Rejected as e:
+        return too_busy(e)
+
+
+def finalize_chunked(request, session, append_to):
+    # Claim the session so a repeated finalize cannot ingest it twice
+    claimed = ChunkedUpload.objects.filter(pk=session.pk, status=ChunkedUpload.UPLOADING).update(
+        status=ChunkedUpload.FINALIZING, updated_at=timezone.now())
+    if not claimed:
+        session.refresh_from_db()
+        return Response({"error": f"Upload is {session.status}", **chunked_status(session)}, status=409)
+
+    expected = request.data.get("sha256")
+    response = None
+    try:
+        if expected and chunked.file_sha256(session) != str(expected).lower():
+            response = Response({"error": "File checksum mismatch"}, status=400)
+        else:
+            with open(chunked.part_path(session), "rb") as f:
+                upload = chunked.PartFile(f, name=session.file_name)
+                response = ingest_files([upload], request.user.pk, append_to,
+                                        settings.CHEMVIZ_CHUNKED_UPLOAD_MAX_BYTES)
+    finally:
+        if response is None or response.status_code != 200:
+            ChunkedUpload.objects.filter(pk=session.pk).update(status=ChunkedUpload.UPLOADING)
+
+    if response.status_code == 200:
+        session.status = ChunkedUpload.COMPLETE
+        session.upload_id = response.data.get("id") or response.data["files"][0]["id"]
+        session.save(update_fields=["status", "upload", "updated_at"])
+        chunked.remove_part(session)
+    return response
+
+
+def announce_uploads(records, user_id):
+    events.publish("upload-progress", {"stage": "complete", "ids": [r.pk for r in records]}, user_id=user_id)
+    for record in records:
+        events.publish("history", history_entry(record))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def history(request):
     records = UploadHistory.objects.all().order_by('-created_at')[:5]
-    data = []
+    return Response([history_entry(r) for r in records])
+
+
+def history_entry(r):
+    return {
+        "id": r.id,
+        "time": r.created_at.strftime("%d-%m-%Y %H:%M"),
+        "file_name": r.file_name,
+        "total_equipment": r.total_equipment,
+        "avg_flowrate": r.avg_flowrate,
+        "avg_pressure": r.avg_pressure,
+        "avg_temperature": r.avg_temperature,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def compare(request):
+    ids = {}
+    for key in ("a", "b"):
+        try:
+            ids[key] = int(request.query_params[key])
+        except (KeyError, ValueError):
+            return Response({"error": "Query parameters 'a' and 'b' must be upload ids"}, status=400)
+
+    uploads = UploadHistory.objects.in_bulk(ids.values())
+    missing = [pk for pk in ids.values() if pk not in uploads]
+    if missing:
+        return Response({"error": f"Upload {missing[0]} not found"}, status=404)
+
+    rows = request.query_params.get("rows") in ("1", "true")
+    return Response(compare_uploads(uploads[ids["a"]], uploads[ids["b"]], rows=rows))
+
+
+def series_arrays(rows, count):
+    """Times (epoch seconds) and an (n, 3) array of metrics, NaN for missing, from up to count rows"""
+    times = np.empty(count)
+    values = np.empty((count, 3))
+    n = 0
+    for n, (recorded_at, *metrics) in enumerate(islice(rows, count), 1):
+        times[n - 1] = recorded_at.timestamp()
+        values[n - 1] = metrics
+    return times[:n], values[:n]
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def equipment_series(request, name):
+    """
+    Flowrate/Pressure/Temperature history of one piece of equipment, downsampled
+    to at most `points` points per metric (method=lttb or minmax). Readings
+    compacted by retention contribute one point per time bucket, its mean, as
+    do all readings when there are more than CHEMVIZ_SERIES_MAX_RAW_POINTS.
+    """
+    method = request.query_params.get("method", "lttb")
+    if method not in DOWNSAMPLE_METHODS:
+        return Response({"error": f"method must be one of {', '.join(DOWNSAMPLE_METHODS)}"}, status=400)
+    try:
+        points = min(int(request.query_params.get("points", 500)), settings.CHEMVIZ_SERIES_MAX_POINTS)
+    except ValueError:
+        return Response({"error": "points must be an integer"}, status=400)
+    if points < 3:
+        return Response({"error": "points must be at least 3"}, status=400)
+
+    readings = EquipmentReading.objects.filter(equipment_name=name)
+    rollups = ReadingRollup.objects.filter(equipment_name=name)
+    for param, op in (("start", "gte"), ("end", "lte")):
+        if param in request.query_params:
+            value = parse_datetime(request.query_params[param])
+            if value is None:
+                return Response({"error": f"{param} must be an ISO 8601 datetime"}, status=400)
+            readings = readings.filter(**{f"recorded_at__{op}": value})
+            rollups = rollups.filter(**{f"bucket_start__{op}": value})
+
+    # Readings are copied straight into arrays as they stream in; past
+    # CHEMVIZ_SERIES_MAX_RAW_POINTS they are averaged per time bucket in the query
+    limit = settings.CHEMVIZ_SERIES_MAX_RAW_POINTS
+    raw_count = readings.count()
+    bucket = None
+    if raw_count > limit:
+        span = readings.aggregate(first=Min('recorded_at'), last=Max('recorded_at'))
+        seconds = (span['last'] - span['first']).total_seconds()
+        bucket = next((kind for kind, size in SERIES_BUCKETS if seconds / size + 2 <= limit), "year")
+        raw = (readings.annotate(bucket=Trunc('recorded_at', bucket)).values('bucket')
+               .annotate(**{f"{m}_mean": Avg(m) for m in ROLLUP_METRICS}).order_by('bucket')
+               .values_list('bucket', *[f"{m}_mean" for m in ROLLUP_METRICS]))
+    else:
+        raw = readings.order_by('recorded_at').values_list('recorded_at', *ROLLUP_METRICS)
+    times, values = series_arrays(raw.iterator(), min(raw_count, limit))
+
+    # A bucket can have several rollup rows (one per compaction batch)
+    buckets = rollups.values('bucket_start').annotate(
+        **{f"{m}_{agg}": Sum(f"{m}_{agg}") for m in ROLLUP_METRICS for agg in ("count", "sum")}
+    ).order_by('bucket_start')
+    compacted = [
+        (b['bucket_start'], *[b[f"{m}_sum"] / b[f"{m}_count"] if b[f"{m}_count"] else None for m in ROLLUP_METRICS])
+        for b in buckets
+    ]
+    if not len(times) and not compacted:
+        return Response({"error": f"No readings for equipment '{name}'"}, status=404)
+    if compacted:
+        # Rollups cover older uploads, but their buckets can interleave with raw readings
+        compacted_times, compacted_values = series_arrays(iter(compacted), len(compacted))
+        times = np.concatenate([compacted_times, times])
+        values = np.concatenate([compacted_values, values])
+        order = np.argsort(times, kind="stable")
+        times, values = times[order], values[order]
+
+    series = {}
+    for j, metric in enumerate(["Flowrate", "Pressure", "Temperature"]):
+        present = ~np.isnan(values[:, j])
+        x, y = times[present], values[present, j]
+        kept = DOWNSAMPLE_METHODS[method](x, y, points)
+        series[metric] = [
+            [datetime.fromtimestamp(t, tz=dt_timezone.utc).isoformat(), v]
+            for t, v in zip(x[kept].tolist(), y[kept].tolist())
+        ]
+
+    return Response({
+        "equipment": name,
+        "type": (readings.values_list('equipment_type', flat=True).last()
+                 or rollups.values_list('equipment_type', flat=True).last()),
+        "method": method,
+        "total_points": raw_count + len(compacted),
+        "compacted_points": len(compacted),
+        "bucketed": bucket,
+        "series": series,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_data(request, dataset, ext):
+    """
+    Stream upload history or stored readings as CSV, NDJSON or Parquet,
+    optionally limited to one upload (?upload=<id>)
+    """
+    if dataset not in export.DATASETS or ext not in export.ENCODERS:
+        return Response({"error": "Unknown dataset or format"}, status=404)
+    if ext == "parquet" and not export.parquet_available():
+        return Response({"error": "Parquet export needs pyarrow installed on the server"}, status=501)
+
+    upload_id = request.query_params.get("upload")
+    if upload_id is not None and not upload_id.isdigit():
+        return Response({"error": "upload must be an upload id"}, status=400)
+
+    queryset, fields = export.export_queryset(dataset, upload_id)
+    # Under ASGI a sync iterator would be read whole before the first byte is sent
+    streamer = export.astream if settings.CHEMVIZ_ASYNC_VIEWS else export.stream
+    response = StreamingHttpResponse(
+        streamer(ext, queryset, fields, settings.CHEMVIZ_EXPORT_CHUNK_ROWS),
+        content_type=export.CONTENT_TYPES[ext],
+    )
+    response['Content-Disposition'] = f'attachment; filename="chemviz_{dataset}.{ext}"'
+    return response
 
-    for r in records:
-        data.append({
-            "time": r.created_at.strftime("%d-%m-%Y %H:%M"),
-            "total_equipment": r.total_equipment,
-            "avg_flowrate": r.avg_flowrate,
-            "avg_pressure": r.avg_pressure,
-            "avg_temperature": r.avg_temperature,
-        })
 
-    return Response(data)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def query_uploads(request):
+    """Filter, group and aggregate stored uploads (see equipment/query.py for the query format)"""
+    try:
+        return Response(query.run(request.data))
+    except query.QueryError as e:
+        return Response({"error": str(e)}, status=400)
 
 
 def add_page_number(section):
@@ -92,12 +710,61 @@ def add_page_number(section):
     run._r.append(instrText)
     run._r.append(fldChar2)
 
+def metric_status(results, metric):
+    """Status cell for the metrics table, based on the anomaly counts from the upload"""
+    anomalies = results.get('anomalies')
+    if not anomalies:
+        return '– Not checked'
+    flagged = anomalies.get('by_metric', {}).get(metric, {}).get('total', 0)
+    if flagged:
+        return f'⚠ {flagged} flagged'
+    return '✓ Within limits'
+
+
+def metric_analysis(results, metric, unit):
+    """Analysis paragraph for one metric, computed from the upload statistics and anomalies"""
+    stats = results.get('statistics', {}).get(metric)
+    anomalies = results.get('anomalies')
+    lines = []
+
+    if stats and stats.get('count'):
+        lines.append(f"<b>Range:</b> {stats['min']:.2f} – {stats['max']:.2f} {unit}")
+        if stats.get('std') is not None:
+            lines.append(f"<b>Standard Deviation:</b> {stats['std']:.2f} {unit}")
+        lines.append(
+            f"<b>Median / P95 / P99:</b> {stats['p50']:.2f} / {stats['p95']:.2f} / {stats['p99']:.2f} {unit}"
+        )
+
+    if not anomalies:
+        lines.append("<br/><b>Analysis:</b> No anomaly check was run for this data set.")
+        return "<br/>".join(lines)
+
+    counts = anomalies.get('by_metric', {}).get(metric, {})
+    total = results.get('total_equipment', 0)
+    flagged = counts.get('total', 0)
+    if not flagged:
+        lines.append(
+            f"<br/><b>Analysis:</b> All {total} readings are within the operating envelope "
+            f"and show no statistical outliers for their equipment type."
+        )
+    else:
+        share = (flagged / total * 100) if total else 0
+        lines.append(
+            f"<br/><b>Analysis:</b> {flagged} readings ({share:.1f}%) were flagged: "
+            f"{counts.get('envelope', 0)} outside the operating envelope, "
+            f"{counts.get('zscore', 0)} by z-score and {counts.get('iqr', 0)} outside the IQR fences "
+            f"for their equipment type. See the anomaly table for the most extreme readings."
+        )
+    return "<br/>".join(lines)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def generate_pdf_report(request):
     """
     Generate a comprehensive PDF report with all analysis data
     Expects JSON body with: results, history, username
+    or upload_id instead of results to re-analyse a stored upload from its archive
     """
     try:
         # Get data from request
@@ -106,7 +773,19 @@ def generate_pdf_report(request):
         history = data.get('history', [])
         username = data.get('username', request.user.username)
         
+        if data.get('upload_id'):
+            if isinstance(data['upload_id'], bool) or not str(data['upload_id']).isdigit():
+                return Response({"error": "upload_id must be an upload id"}, status=400)
+            upload = UploadHistory.objects.filter(pk=int(data['upload_id'])).first()
+            with timing.stage("archive_read"):
+                table = read_archive(upload, columns=['Equipment Name', 'Type'] + METRICS) if upload else None
+            if table is None:
+                return Response({"error": "No archived data for this upload"}, status=404)
+            with timing.stage("aggregate"):
+                results = finalize_summary(partial_aggregate(table.to_pandas(), anomaly_options=anomaly_options()))
+        
         # Create PDF in memory
+        story_started = timing.clock()
         buffer = BytesIO()
         doc = SimpleDocTemplate(
             buffer,
@@ -235,9 +914,9 @@ def generate_pdf_report(request):
         metrics_data = [
             ['Metric', 'Value', 'Status'],
             ['Total Equipment', str(total_equipment), '✓ Operational'],
-            ['Average Flowrate', f"{avg_flowrate:.2f} L/min", '↑ Stable'],
-            ['Average Temperature', f"{avg_temp:.2f}°C", '→ Normal'],
-            ['Average Pressure', f"{avg_pressure:.2f} PSI", '✓ Optimal'],
+            ['Average Flowrate', f"{avg_flowrate:.2f} L/min", metric_status(results, 'Flowrate')],
+            ['Average Temperature', f"{avg_temp:.2f}°C", metric_status(results, 'Temperature')],
+            ['Average Pressure', f"{avg_pressure:.2f} PSI", metric_status(results, 'Pressure')],
         ]
         
         metrics_table = Table(metrics_data, colWidths=[2.5*inch, 2*inch, 1.5*inch])
@@ -305,9 +984,7 @@ def generate_pdf_report(request):
         elements.append(Paragraph("Flowrate Analysis", subheading_style))
         flowrate_text = f"""
         <b>Average Flowrate:</b> {avg_flowrate:.2f} L/min<br/>
-        <b>Peak Flowrate (Estimated):</b> {(avg_flowrate * 1.2):.2f} L/min<br/><br/>
-        <b>Analysis:</b> The flowrate measurements indicate stable operation within normal parameters. 
-        Consistent flowrate suggests proper pump operation and minimal system resistance.
+        {metric_analysis(results, 'Flowrate', 'L/min')}
         """
         elements.append(Paragraph(flowrate_text, body_style))
         elements.append(Spacer(1, 10))
@@ -315,10 +992,8 @@ def generate_pdf_report(request):
         # Temperature Analysis
         elements.append(Paragraph("Temperature Analysis", subheading_style))
         temp_text = f"""
-        <b>Average Temperature:</b> {avg_temp:.2f}°C<br/><br/>
-        <b>Analysis:</b> Temperature readings are within acceptable operational ranges. 
-        Monitoring temperature trends helps identify potential cooling system issues 
-        or equipment stress before they become critical.
+        <b>Average Temperature:</b> {avg_temp:.2f}°C<br/>
+        {metric_analysis(results, 'Temperature', '°C')}
         """
         elements.append(Paragraph(temp_text, body_style))
         elements.append(Spacer(1, 10))
@@ -326,12 +1001,49 @@ def generate_pdf_report(request):
         # Pressure Analysis
         elements.append(Paragraph("Pressure Analysis", subheading_style))
         pressure_text = f"""
-        <b>Average Pressure:</b> {avg_pressure:.2f} PSI<br/><br/>
-        <b>Analysis:</b> Pressure measurements indicate system integrity and proper valve operation. 
-        Consistent pressure readings suggest minimal leakage and optimal system configuration.
+        <b>Average Pressure:</b> {avg_pressure:.2f} PSI<br/>
+        {metric_analysis(results, 'Pressure', 'PSI')}
         """
         elements.append(Paragraph(pressure_text, body_style))
         
+        # ==================== ANOMALIES ====================
+        anomaly_rows = results.get('anomalies', {}).get('rows', [])
+        if anomaly_rows:
+            elements.append(Spacer(1, 20))
+            elements.append(Paragraph("Flagged Readings", heading_style))
+            flagged_total = results['anomalies'].get('total_flagged', len(anomaly_rows))
+            elements.append(Paragraph(
+                f"{flagged_total} equipment readings were flagged. The most extreme are listed below:",
+                body_style
+            ))
+            
+            anomaly_data = [['Equipment', 'Type', 'Metric', 'Value', 'Z-Score', 'Reason']]
+            for row in anomaly_rows[:20]:
+                anomaly_data.append([
+                    str(row.get('equipment') or f"Row {row.get('row')}"),
+                    str(row.get('type', '')),
+                    str(row.get('metric', '')),
+                    f"{row.get('value', 0):.2f}",
+                    f"{row.get('zscore', 0):.2f}",
+                    ', '.join(row.get('reasons', [])),
+                ])
+            
+            anomaly_table = Table(anomaly_data, colWidths=[1.4*inch, 1.1*inch, 1*inch, 0.8*inch, 0.8*inch, 1.4*inch])
+            anomaly_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#f97316')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 10),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+                ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+                ('FONTSIZE', (0, 1), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#fff7ed')]),
+            ]))
+            elements.append(anomaly_table)
+        
         # Page break
         elements.append(PageBreak())
         
@@ -433,24 +1145,27 @@ def generate_pdf_report(request):
         """
         elements.append(Paragraph(footer_text, metadata_style))
         
+        metrics.report_duration.observe(timing.record("story_build", story_started), stage="story_build")
+        
         # Build PDF
+        build_started = timing.clock()
         doc.build(elements)
+        metrics.report_duration.observe(timing.record("doc_build", build_started), stage="doc_build")
         
-        # Get PDF from buffer
-        buffer.seek(0)
-        pdf = buffer.getvalue()
-        buffer.close()
-        
-        # Create HTTP response
-        response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="ChemViz_Report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
+        with timing.stage("response"):
+            # Get PDF from buffer
+            buffer.seek(0)
+            pdf = buffer.getvalue()
+            buffer.close()
+            
+            # Create HTTP response
+            response = HttpResponse(pdf, content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="ChemViz_Report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf"'
         
         return response
         
     except Exception as e:
-        import traceback
-        print("PDF Generation Error:")
-        print(traceback.format_exc())
+        logger.exception("PDF generation failed")
         return Response({"error": str(e)}, status=500)
 
 
@@ -465,7 +1180,7 @@ def login_view(request):
     if user is None:
         return Response({"error": "Invalid credentials"}, status=401)
 
-    token, _ = Token.objects.get_or_create(user=user)
+    token = issue_token(user)
     return Response({"token": token.key})
 
 
@@ -482,4 +1197,9 @@ def create_user(request):
         return Response({"error": "User already exists"}, status=400)
 
     User.objects.create_user(username=username, password=password)
-    return Response({"message": "User created successfully"})
\ No newline at end of file
+    return Response({"message": "User created successfully"})
+
+
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint (unauthenticated; restrict it at the proxy)."""
+    return HttpResponse(metrics.render(metrics.registry.collect()), content_type=metrics.CONTENT_TYPE)
@@ -53,6 +53,8 @@ function App() {
   const [historyList, setHistoryList] = useState([]);
   const [activeView, setActiveView] = useState('overview'); // overview, analytics, history
   const [downloadingReport, setDownloadingReport] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(null);
+  const [liveUpdates, setLiveUpdates] = useState(false);
 
   /* ================= LOGIN ================= */
   const loginUser = async () => {
@@ -112,10 +114,16 @@ function App() {
         }
       );
       setResults(response.data.summary);
-      loadHistory();
+      // With the event stream open the new row arrives as a "history" event
+      if (!liveUpdates) {
+        loadHistory();
+      }
     } catch (error) {
       console.error("Upload failed:", error);
       alert("Upload failed (Unauthorized or backend error)");
+    } finally {
+      // Also cleared by the "complete"/"failed" events, but those can be missed
+      setUploadProgress(null);
     }
   };
 
@@ -135,6 +143,41 @@ function App() {
     }
   };
 
+  /* ================= LIVE UPDATES (SSE) ================= */
+  useEffect(() => {
+    if (!authenticated || !token) {
+      return;
+    }
+    loadHistory();
+
+    // EventSource cannot send headers, so the token goes in the query string
+    const source = new EventSource(
+      `http://127.0.0.1:8000/api/events/?token=${encodeURIComponent(token)}`
+    );
+    source.onopen = () => setLiveUpdates(true);
+    source.onerror = () => setLiveUpdates(false);
+
+    source.addEventListener('history', (e) => {
+      const entry = JSON.parse(e.data);
+      setHistoryList((prev) =>
+        [entry, ...prev.filter((item) => item.id !== entry.id)].slice(0, 5)
+      );
+    });
+
+    source.addEventListener('upload-progress', (e) => {
+      const progress = JSON.parse(e.data);
+      setUploadProgress(
+        progress.stage === 'complete' || progress.stage === 'failed' ? null : progress
+      );
+    });
+
+    return () => {
+      source.close();
+      setLiveUpdates(false);
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [authenticated, token]);
+
   /* ================= DOWNLOAD PDF REPORT ================= */
   const handleDownloadPDFReport = async () => {
     if (!results) {
@@ -353,9 +396,18 @@ function App() {
           <button
             onClick={handleUpload}
             className="btn-blue"
-            disabled={!selectedFile}
+            disabled={!selectedFile || uploadProgress !== null}
           >
-            Upload & Analyze
+            {uploadProgress ? (
+              <>
+                <span className="spinner"></span>
+                {uploadProgress.stage === 'parsing'
+                  ? `${uploadProgress.rows.toLocaleString()} rows...`
+                  : 'Uploading...'}
+              </>
+            ) : (
+              'Upload & Analyze'
+            )}
           </button>
 
           {/* PDF Download Button */}
@@ -624,7 +676,7 @@ function App() {
       <div className="dashboard-footer">
         <span>ChemViz Systems v2.0.5</span>
         <span>•</span>
-        <span>Last sync: Just now</span>
+        <span>{liveUpdates ? 'Live updates' : 'Last sync: Just now'}</span>
         <span>•</span>
         <span className="footer-status">
           <span className="status-dot online"></span> All Systems Operational
@@ -1,4 +1,7 @@
 import sys
+import os
+import time
+import hashlib
 import requests
 import json
 from PyQt5.QtWidgets import (
@@ -6,7 +9,7 @@ from PyQt5.QtWidgets import (
     QLabel, QPushButton, QLineEdit, QFileDialog, QTableWidget,
     QTableWidgetItem, QTabWidget, QTextEdit, QMessageBox, QGridLayout
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 
@@ -15,6 +18,9 @@ from matplotlib.figure import Figure
 # CONFIGURATION
 # ============================================
 BACKEND_URL = "http://127.0.0.1:8000"
+CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024  # larger files are sent in resumable chunks
+CHUNK_RETRIES = 5
+RESUME_FILE = os.path.join(os.path.expanduser("~"), ".chemviz_uploads.json")  # unfinished uploads
 
 
 # ============================================
@@ -104,6 +110,176 @@ class LoginWindow(QWidget):
             print(f"Login error: {e}")
 
 
+# ============================================
+# LIVE UPDATES (SERVER-SENT EVENTS)
+# ============================================
+class EventStreamThread(QThread):
+    """Listens to /api/events/ in the background and emits each event"""
+    
+    event_received = pyqtSignal(str, dict)
+    
+    def __init__(self, token):
+        super().__init__()
+        self.token = token
+        self.response = None
+        self.running = True
+    
+    def run(self):
+        """Read events until stopped, reconnecting after network errors"""
+        while self.running:
+            try:
+                self.response = requests.get(
+                    f"{BACKEND_URL}/api/events/",
+                    headers={'Authorization': f'Token {self.token}'},
+                    stream=True,
+                    timeout=(5, 60)
+                )
+                if self.response.status_code != 200:
+                    # e.g. 501 when the backend is not running under ASGI
+                    return
+                self.read_events(self.response)
+            except Exception as e:
+                if self.running:
+                    print(f"Event stream error: {e}")
+            if self.running:
+                self.sleep(5)
+    
+    def read_events(self, response):
+        """Parse the text/event-stream format line by line"""
+        event, data = "message", []
+        for line in response.iter_lines(decode_unicode=True):
+            if not self.running:
+                return
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                data.append(line[5:].strip())
+            elif line == "" and data:
+                self.event_received.emit(event, json.loads("\n".join(data)))
+                event, data = "message", []
+    
+    def stop(self):
+        """Stop listening (closing the response unblocks the read)"""
+        self.running = False
+        if self.response is not None:
+            self.response.close()
+        self.wait(2000)
+
+
+class UploadThread(QThread):
+    """
+    Uploads a CSV file without blocking the window. Large files go through the
+    resumable API in chunks; if the connection drops for good, uploading the
+    same file again continues from the last chunk the server received.
+    """
+    
+    upload_finished = pyqtSignal(object, str)  # response JSON or None, error message
+    upload_progress = pyqtSignal(int)  # percent sent, for chunked uploads
+    
+    def __init__(self, file_path, token):
+        super().__init__()
+        self.file_path = file_path
+        self.token = token
+        self.headers = {'Authorization': f'Token {token}'}
+    
+    def run(self):
+        try:
+            if os.path.getsize(self.file_path) > CHUNKED_UPLOAD_THRESHOLD:
+                response = self.upload_chunked()
+            else:
+                with open(self.file_path, 'rb') as f:
+                    response = requests.post(
+                        f"{BACKEND_URL}/api/upload/",
+                        files={'file': f},
+                        headers=self.headers
+                    )
+            if response.status_code == 200:
+                self.upload_finished.emit(response.json(), "")
+            else:
+                self.upload_finished.emit(None, "")
+        except Exception as e:
+            self.upload_finished.emit(None, str(e))
+    
+    def upload_chunked(self):
+        """Send the file in chunks (resuming an earlier attempt) and finalize it"""
+        size = os.path.getsize(self.file_path)
+        key = f"{os.path.abspath(self.file_path)}|{size}|{int(os.path.getmtime(self.file_path))}"
+        saved = load_resume_state()
+        session = self.resume_session(saved.get(key))
+        if session is None:
+            response = requests.post(
+                f"{BACKEND_URL}/api/uploads/chunked/",
+                json={'file_name': os.path.basename(self.file_path), 'size': size},
+                headers=self.headers
+            )
+            response.raise_for_status()
+            session = response.json()
+            saved[key] = {'id': session['id'], 'chunk_size': session['chunk_size']}
+            save_resume_state(saved)
+        
+        chunk_size = saved[key]['chunk_size']
+        offset = session['offset']
+        with open(self.file_path, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                offset = self.send_chunk(session['id'], offset, f.read(chunk_size))
+                self.upload_progress.emit(int(offset * 100 / size))
+        
+        response = requests.post(f"{BACKEND_URL}/api/uploads/chunked/{session['id']}/finalize/",
+                                 headers=self.headers)
+        if response.status_code == 200:
+            saved = load_resume_state()
+            saved.pop(key, None)
+            save_resume_state(saved)
+        return response
+    
+    def resume_session(self, entry):
+        """Status of an earlier unfinished upload of this file, or None to start over"""
+        if not entry:
+            return None
+        response = requests.get(f"{BACKEND_URL}/api/uploads/chunked/{entry['id']}/", headers=self.headers)
+        if response.status_code != 200 or response.json()['status'] != 'uploading':
+            return None
+        return response.json()
+    
+    def send_chunk(self, session_id, offset, chunk):
+        """PUT one chunk, retrying network errors; returns the server's new offset"""
+        for attempt in range(CHUNK_RETRIES):
+            try:
+                response = requests.put(
+                    f"{BACKEND_URL}/api/uploads/chunked/{session_id}/",
+                    params={'offset': offset},
+                    data=chunk,
+                    headers={**self.headers, 'Content-Type': 'application/octet-stream',
+                             'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest()},
+                    timeout=(10, 120)
+                )
+            except requests.RequestException:
+                if attempt == CHUNK_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+                continue
+            # 409: the server is at another offset (e.g. an earlier try did arrive)
+            if response.status_code in (200, 409):
+                return response.json()['offset']
+            if response.status_code != 400 or attempt == CHUNK_RETRIES - 1:
+                response.raise_for_status()
+        raise RuntimeError("Chunk could not be uploaded")
+
+
+def load_resume_state():
+    try:
+        with open(RESUME_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_resume_state(state):
+    with open(RESUME_FILE, 'w') as f:
+        json.dump(state, f)
+
+
 # ============================================
 # MAIN DASHBOARD WINDOW
 # ============================================
@@ -117,6 +293,11 @@ class DashboardWindow(QMainWindow):
         self.history_data = []  # Store history data
         self.selected_file = None  # Store selected file path
         self.setup_window()
+        
+        # Push updates: new uploads from any user, progress of our own
+        self.event_thread = EventStreamThread(self.main_app.token)
+        self.event_thread.event_received.connect(self.handle_event)
+        self.event_thread.start()
     
     def setup_window(self):
         """Setup the main dashboard window"""
@@ -298,33 +479,30 @@ class DashboardWindow(QMainWindow):
         self.upload_btn.setEnabled(False)
         self.upload_btn.setText("Uploading...")
         
-        try:
-            # Open and send file
-            with open(self.selected_file, 'rb') as f:
-                files = {'file': f}
-                headers = {'Authorization': f'Token {self.main_app.token}'}
-                
-                response = requests.post(
-                    f"{BACKEND_URL}/api/upload/",
-                    files=files,
-                    headers=headers
-                )
-                
-                if response.status_code == 200:
-                    # Success!
-                    self.results = response.json()['summary']
-                    self.update_all_data()
-                    QMessageBox.information(self, "Success", "File uploaded successfully!")
-                else:
-                    QMessageBox.warning(self, "Error", "Upload failed!")
-        
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error: {str(e)}")
-        
-        finally:
-            # Re-enable button
-            self.upload_btn.setEnabled(True)
-            self.upload_btn.setText("Upload & Analyze")
+        # Upload in the background so pushed progress events can be shown
+        self.upload_thread = UploadThread(self.selected_file, self.main_app.token)
+        self.upload_thread.upload_finished.connect(self.upload_finished)
+        self.upload_thread.upload_progress.connect(
+            lambda percent: self.upload_btn.setText(f"Uploading... {percent}%"))
+        self.upload_thread.start()
+    
+    def upload_finished(self, data, error):
+        """Handle the result of a background upload"""
+        # Re-enable button
+        self.upload_btn.setEnabled(True)
+        self.upload_btn.setText("Upload & Analyze")
+        
+        if data is not None:
+            # Success!
+            self.results = data['summary']
+            self.update_all_data()
+            QMessageBox.information(self, "Success", "File uploaded successfully!")
+        elif error:
+            if os.path.getsize(self.selected_file) > CHUNKED_UPLOAD_THRESHOLD:
+                error += "\n\nUpload the same file again to resume where it stopped."
+            QMessageBox.critical(self, "Error", f"Error: {error}")
+        else:
+            QMessageBox.warning(self, "Error", "Upload failed!")
     
     # ========================================
     # UPDATE UI WITH DATA
@@ -373,6 +551,16 @@ class DashboardWindow(QMainWindow):
         except Exception as e:
             print(f"Error loading history: {e}")
     
+    def handle_event(self, event, data):
+        """Apply a pushed event (runs in the GUI thread)"""
+        if event == "history":
+            others = [item for item in self.history_data if item.get('id') != data['id']]
+            self.history_data = ([data] + others)[:5]
+            self.update_history_table()
+            self.update_line_chart()
+        elif event == "upload-progress" and data.get('stage') == "parsing" and not self.upload_btn.isEnabled():
+            self.upload_btn.setText(f"Uploading... {data['rows']:,} rows")
+    
     def update_history_table(self):
         """Update the history table with data"""
         self.history_table.setRowCount(len(self.history_data))
@@ -434,6 +622,11 @@ class DashboardWindow(QMainWindow):
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Error: {str(e)}")
     
+    def closeEvent(self, event):
+        """Stop the event stream when the window closes"""
+        self.event_thread.stop()
+        super().closeEvent(event)
+    
     def logout(self):
         """Logout and return to login screen"""
         self.close()